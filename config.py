@@ -11,6 +11,53 @@ INSTAGRAM_USERNAME = os.getenv("INSTAGRAM_USERNAME")
 INSTAGRAM_PASSWORD = os.getenv("INSTAGRAM_PASSWORD")
 INSTAGRAM_SESSION_DATA = os.getenv("INSTAGRAM_SESSION_DATA")
 
+# Video akışı (indirme -> Gemini yükleme hattı)
+# Her parça bu boyutta tamponlanır; bellek kullanımı parça boyutuyla sınırlıdır.
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", str(8 * 1024 * 1024)))
+# İndirme ile yükleme arasında bekleyebilecek en fazla parça sayısı
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "2"))
+
+# HTTP bağlantı havuzu (indirme, yükleme ve Gemini çağrıları için ortak)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "120"))
+
+# Çeviri hafızası (boş bırakılırsa sadece bellekte tutulur)
+TRANSLATION_MEMORY_PATH = os.getenv(
+    "TRANSLATION_MEMORY_PATH",
+    os.path.join(os.path.dirname(__file__), 'translation_memory.json')
+)
+TRANSLATION_MEMORY_SIZE = int(os.getenv("TRANSLATION_MEMORY_SIZE", "5000"))
+
+# Gemini modelleri (virgülle ayrılmış, öncelik sırasıyla; ilki birincil, diğerleri yedek)
+GEMINI_TEXT_MODELS = [m.strip() for m in os.getenv(
+    "GEMINI_TEXT_MODELS", "gemini-2.0-flash,gemini-2.5-flash,gemini-2.0-flash-lite"
+).split(",") if m.strip()]
+GEMINI_IMAGE_MODELS = [m.strip() for m in os.getenv(
+    "GEMINI_IMAGE_MODELS", "gemini-3-pro-image-preview,gemini-2.5-flash-image"
+).split(",") if m.strip()]
+# Yavaş yanıtlarda p95 gecikmesinden sonra ikinci istek gönderilsin mi
+GEMINI_HEDGE_REQUESTS = os.getenv("GEMINI_HEDGE_REQUESTS", "true").lower() in ("1", "true", "yes")
+
+# Kullanım bütçeleri (kullanıcı başına günlük; 0 = sınırsız)
+DAILY_TOKEN_BUDGET = int(os.getenv("DAILY_TOKEN_BUDGET", "0"))
+DAILY_IMAGE_BUDGET = int(os.getenv("DAILY_IMAGE_BUDGET", "0"))
+
+# Admin komutlarını kullanabilecek Telegram kullanıcı ID'leri (virgülle ayrılmış)
+ADMIN_USER_IDS = {int(i) for i in os.getenv("ADMIN_USER_IDS", "").split(",") if i.strip()}
+
+# Toplu işlem: mesaj/profil başına en fazla video ve eşzamanlı iş sınırları
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "10"))
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", "8"))
+USER_CONCURRENT_JOBS = int(os.getenv("USER_CONCURRENT_JOBS", "3"))
+
+# Profil (opsiyonel): sıradaki N iş örnekleyici profiler + bellek takibiyle çalışır
+PROFILE_NEXT_JOBS = int(os.getenv("PROFILE_NEXT_JOBS", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(__file__), 'profiles'))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+# Event loop bu süreden (saniye) uzun bloklanırsa yığın loglanır; 0 = kapalı
+LOOP_STALL_THRESHOLD = float(os.getenv("LOOP_STALL_THRESHOLD", "0"))
+
 if not TELEGRAM_BOT_TOKEN:
     raise ValueError("TELEGRAM_BOT_TOKEN environment variable is not set")
 
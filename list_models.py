@@ -1,10 +1,23 @@
-import google.generativeai as genai
+from google import genai
 from config import GEMINI_API_KEY
-import pprint
 
-genai.configure(api_key=GEMINI_API_KEY)
 
-print("Available models:")
-for m in genai.list_models():
-    if 'generateContent' in m.supported_generation_methods:
-        print(f"- {m.name}")
+def generate_model_names(models) -> list[str]:
+    """generateContent destekleyen modellerin adlarını döndürür (ör. "gemini-2.0-flash")."""
+    return [
+        m.name.removeprefix("models/")
+        for m in models
+        if 'generateContent' in (m.supported_actions or [])
+    ]
+
+
+def list_generate_models() -> list[str]:
+    """API anahtarıyla erişilebilen, generateContent destekleyen modelleri listeler."""
+    client = genai.Client(api_key=GEMINI_API_KEY)
+    return generate_model_names(client.models.list())
+
+
+if __name__ == "__main__":
+    print("Available models:")
+    for name in list_generate_models():
+        print(f"- models/{name}")
@@ -0,0 +1,91 @@
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class FairShareLimiter:
+    """
+    Eşzamanlı iş sayısını hem genel hem kullanıcı başına sınırlar.
+
+    Kullanıcı sınırı, tek bir kullanıcının büyük bir toplu isteğinin tüm
+    genel kapasiteyi tüketmesini engeller.
+    """
+
+    def __init__(self, global_limit: int, per_user_limit: int):
+        self.per_user_limit = per_user_limit
+        self._global = asyncio.Semaphore(global_limit)
+        # Kullanıcı -> [semafor, bekleyen + çalışan iş sayısı]; boşalınca silinir
+        self._users: dict[int, list] = {}
+
+    @asynccontextmanager
+    async def slot(self, user_id: int):
+        entry = self._users.setdefault(user_id, [asyncio.Semaphore(self.per_user_limit), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._global:
+                    yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._users[user_id]
+
+
+class ProgressReporter:
+    """Tek bir ilerleme mesajını Telegram sınırlarına takılmadan (seyrek) günceller."""
+
+    def __init__(self, edit: Callable[[str], Awaitable], min_interval: float = 2.0):
+        self.edit = edit
+        self.min_interval = min_interval
+        self._last_edit = 0.0
+        self._last_text = None
+
+    async def update(self, text: str, force: bool = False):
+        now = time.monotonic()
+        if text == self._last_text or (not force and now - self._last_edit < self.min_interval):
+            return
+        self._last_edit = now
+        self._last_text = text
+        try:
+            await self.edit(text)
+        except Exception as e:
+            # İlerleme mesajı güncellenemese de iş devam eder
+            logger.warning(f"İlerleme mesajı güncellenemedi: {e}")
+
+
+async def run_batch(
+    items: list,
+    worker: Callable[[object], Awaitable],
+    limiter: FairShareLimiter,
+    user_id: int,
+    on_progress: Callable[[int, int, int], Awaitable] | None = None,
+) -> list:
+    """
+    `items` üzerinde `worker`'ı kullanıcının adil payı içinde eşzamanlı çalıştırır.
+
+    Returns:
+        Girdi sırasıyla sonuçlar; başarısız öğeler için yakalanan Exception
+    """
+    results = [None] * len(items)
+    done = 0
+    failed = 0
+
+    async def run(index: int, item):
+        nonlocal done, failed
+        async with limiter.slot(user_id):
+            try:
+                results[index] = await worker(item)
+            except Exception as e:
+                logger.error(f"Toplu iş öğesi başarısız ({item}): {e}")
+                results[index] = e
+                failed += 1
+        done += 1
+        if on_progress:
+            await on_progress(done, failed, len(items))
+
+    await asyncio.gather(*(run(i, item) for i, item in enumerate(items)))
+    return results
@@ -1,64 +1,273 @@
-import time
 import io
 import os
-import google.generativeai as genai
-from google import genai as genai_new
+import asyncio
+import logging
+from collections import Counter
+import httpx
+from google import genai
 from google.genai import types
-from config import GEMINI_API_KEY
+from config import (
+    GEMINI_API_KEY, STREAM_CHUNK_SIZE, STREAM_QUEUE_SIZE, TRANSLATION_MEMORY_PATH, TRANSLATION_MEMORY_SIZE,
+    GEMINI_TEXT_MODELS, GEMINI_IMAGE_MODELS, GEMINI_HEDGE_REQUESTS, DAILY_TOKEN_BUDGET, DAILY_IMAGE_BUDGET,
+)
+from list_models import generate_model_names
+from modules.http_client import get_http_client
+from modules.model_policy import ModelRouter, StagePolicy, TryNextModel, is_retryable
+from modules.translation_memory import (
+    TranslationMemory, detect_language, estimate_tokens, parse_numbered_lines, split_sentences_with_separators,
+)
+from modules.usage import UsageLedger, truncate_to_token_budget
+
+logger = logging.getLogger(__name__)
+
+# Tüm aşamaların (transkript, metin, görsel) paylaştığı tek Gemini client'ı.
+# Çağrılar native async arayüzle (genai_client.aio) yapılır ve Instagram
+# indirmeleri / dosya yüklemeleriyle aynı httpx havuzunu kullanır; süreçte tek
+# bir bağlantı havuzu vardır. (Özel client verildiğinde SDK aiohttp'ye geçmez.)
+genai_client = genai.Client(
+    api_key=GEMINI_API_KEY,
+    http_options=types.HttpOptions(httpx_async_client=get_http_client()),
+)
+
+# Tekrarlanan çevirileri model çağırmadan döndürmek için hafıza
+translation_memory = TranslationMemory(TRANSLATION_MEMORY_PATH or None, TRANSLATION_MEMORY_SIZE)
+
+# Her Gemini çağrısının token/görsel kullanımı (iş, kullanıcı ve aksiyon bazında)
+usage_ledger = UsageLedger(DAILY_TOKEN_BUDGET, DAILY_IMAGE_BUDGET)
+
+# Prompt'lara eklenecek transkript parçası için token bütçeleri
+TRANSCRIPT_TOKEN_BUDGETS = {
+    'hook': 150,
+    'thumbnail_prompt': 150,
+    'topic': 250,
+}
+
+# Aşama başına çağrı politikaları (video ve görsel pahalı olduğu için hedge edilmez)
+STAGE_POLICIES = {
+    'transcribe': StagePolicy(GEMINI_TEXT_MODELS, deadline=180, attempt_timeout=120, max_retries=1),
+    'translate': StagePolicy(GEMINI_TEXT_MODELS, deadline=60, attempt_timeout=30, max_retries=2,
+                             hedge=GEMINI_HEDGE_REQUESTS, hedge_delay=8),
+    'hook': StagePolicy(GEMINI_TEXT_MODELS, deadline=30, attempt_timeout=15, max_retries=2,
+                        hedge=GEMINI_HEDGE_REQUESTS, hedge_delay=4),
+    'thumbnail_prompt': StagePolicy(GEMINI_TEXT_MODELS, deadline=30, attempt_timeout=15, max_retries=2,
+                                    hedge=GEMINI_HEDGE_REQUESTS, hedge_delay=4),
+    'topic': StagePolicy(GEMINI_TEXT_MODELS, deadline=30, attempt_timeout=15, max_retries=2,
+                         hedge=GEMINI_HEDGE_REQUESTS, hedge_delay=4),
+    'image': StagePolicy(GEMINI_IMAGE_MODELS, deadline=180, attempt_timeout=120, max_retries=1),
+}
+
+# list_models ile keşfedilen modeller (ilk çağrıda bir kez doldurulur)
+_available_models = None
+_models_discovered = False
+
+
+def _is_retryable(error: BaseException) -> bool:
+    """Politikanın geçici hata tanımına httpx ağ hatalarını da ekler."""
+    return isinstance(error, httpx.TransportError) or is_retryable(error)
+
+
+router = ModelRouter(STAGE_POLICIES, available_models=lambda: _available_models, retryable=_is_retryable)
+
+# Yüklenen videonun PROCESSING durumundan çıkması için en fazla beklenecek süre (saniye)
+FILE_PROCESSING_TIMEOUT = 300
+
+# Files API resumable upload adresi
+GEMINI_UPLOAD_URL = "https://generativelanguage.googleapis.com/upload/v1beta/files"
+
+# Akış kuyruğunda indirme bitişini bildiren işaret
+_STREAM_END = object()
+
+
+async def _discover_models():
+    """Erişilebilir modelleri bir kez keşfeder; başarısız olursa filtreleme yapılmaz."""
+    global _available_models, _models_discovered
+    if _models_discovered:
+        return
+    _models_discovered = True
+    try:
+        pager = await genai_client.aio.models.list()
+        _available_models = set(generate_model_names([model async for model in pager]))
+    except Exception as e:
+        logger.warning(f"Model listesi alınamadı, yedek modeller filtrelenmeden kullanılacak: {e}")
+
+
+async def _generate_text(stage: str, contents) -> str:
+    """Metin üreten Gemini çağrısını aşama politikasıyla yürütür."""
+    await _discover_models()
+
+    async def request(model_name: str) -> str:
+        response = await genai_client.aio.models.generate_content(model=model_name, contents=contents)
+        usage_ledger.record(response.usage_metadata)
+        return response.text.strip()
+
+    return await router.run(stage, request)
+
+
+async def _upload_video_stream(video_stream) -> str:
+    """
+    Video akışını Gemini Files API'ye resumable upload ile parça parça yükler.
+
+    İndirme ayrı bir task'ta sürerken hazır parçalar yüklenir; diske hiçbir şey
+    yazılmaz ve bellekte en fazla STREAM_QUEUE_SIZE + 2 parça tutulur.
+    Video tek parçaya sığıyorsa tek istekle (bellekten) yüklenir.
+
+    Returns:
+        Yüklenen dosyanın adı (ör. "files/abc123")
+    """
+    http = get_http_client()
+    start_headers = {
+        'x-goog-api-key': GEMINI_API_KEY,
+        'X-Goog-Upload-Protocol': 'resumable',
+        'X-Goog-Upload-Command': 'start',
+        'X-Goog-Upload-Header-Content-Type': video_stream.mime_type,
+    }
+    if video_stream.size:
+        start_headers['X-Goog-Upload-Header-Content-Length'] = str(video_stream.size)
+
+    response = await http.post(
+        GEMINI_UPLOAD_URL,
+        headers=start_headers,
+        json={'file': {'display_name': video_stream.shortcode}},
+    )
+    response.raise_for_status()
+    upload_url = response.headers['X-Goog-Upload-URL']
+
+    # Ara parçalar sunucunun parça katsayısının katı olmalı
+    granularity = int(response.headers.get('X-Goog-Upload-Chunk-Granularity', 1))
+    chunk_size = max(granularity, STREAM_CHUNK_SIZE // granularity * granularity)
+
+    chunks = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+
+    async def produce():
+        # Kuyruk doluysa indirme bekler; bellek kullanımı böylece sınırlı kalır
+        try:
+            async for chunk in video_stream.iter_chunks(chunk_size):
+                await chunks.put(chunk)
+            await chunks.put(_STREAM_END)
+        except Exception as e:
+            await chunks.put(e)
+
+    async def next_chunk():
+        item = await chunks.get()
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    producer = asyncio.create_task(produce())
+    try:
+        offset = 0
+        current = await next_chunk()
+        if current is _STREAM_END:
+            raise ValueError("Video akışı boş.")
+
+        while True:
+            following = await next_chunk()
+            is_last = following is _STREAM_END
+            response = await http.post(
+                upload_url,
+                headers={
+                    'X-Goog-Upload-Offset': str(offset),
+                    'X-Goog-Upload-Command': 'upload, finalize' if is_last else 'upload',
+                },
+                content=current,
+            )
+            response.raise_for_status()
+            offset += len(current)
+            if is_last:
+                return response.json()['file']['name']
+            current = following
+    finally:
+        producer.cancel()
 
-# Gemini API yapılandırması (eski SDK - transkript için)
-genai.configure(api_key=GEMINI_API_KEY)
 
-# Yeni Gemini client (Nano Banana Pro için)
-genai_client = genai_new.Client(api_key=GEMINI_API_KEY)
+async def _delete_file(name: str):
+    """Yüklenen dosyayı siler; hata olursa sessizce geçer (dosya 48 saatte kendiliğinden silinir)."""
+    try:
+        await genai_client.aio.files.delete(name=name)
+    except Exception:
+        pass
 
 
-async def transcribe_video(video_path: str) -> str:
+async def upload_video(video) -> types.File:
     """
-    Video dosyasından transkript çıkarır.
+    Videoyu Gemini'ye yükler ve işlenmesini bekler.
 
     Args:
-        video_path: Video dosyasının yolu
+        video: `iter_chunks` sağlayan video akışı (bkz. instagram.VideoStream)
 
     Returns:
-        Transkript metni
+        İşlenmiş Gemini dosya nesnesi
     """
-    model = genai.GenerativeModel('gemini-2.0-flash')
+    file_name = await _upload_video_stream(video)
+    video_file = await genai_client.aio.files.get(name=file_name)
+
+    # Dosyanın işlenmesini bekle; takılan dosya kullanıcının iş slotunu sonsuza kadar tutmasın
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + FILE_PROCESSING_TIMEOUT
+    while video_file.state == types.FileState.PROCESSING:
+        if loop.time() >= deadline:
+            await _delete_file(video_file.name)
+            raise TimeoutError(f"Video {FILE_PROCESSING_TIMEOUT}s içinde işlenemedi.")
+        await asyncio.sleep(2)
+        video_file = await genai_client.aio.files.get(name=video_file.name)
+
+    if video_file.state == types.FileState.FAILED:
+        raise ValueError("Video işlenirken hata oluştu.")
+
+    return video_file
+
 
+async def transcribe_video(video) -> str:
+    """
+    Videodan transkript çıkarır.
+
+    Args:
+        video: Video akışı
+
+    Returns:
+        Transkript metni
+    """
     # Video dosyasını yükle
-    video_file = genai.upload_file(video_path)
-    
-    # Dosyanın işlenmesini bekle
-    while video_file.state.name == "PROCESSING":
-        time.sleep(2)
-        video_file = genai.get_file(video_file.name)
-
-    if video_file.state.name == "FAILED":
-        raise ValueError("Video işlenirken hata oluştu.")
+    video_file = await upload_video(video)
 
     # Transkript iste
     prompt = """Bu videodaki konuşmaları tam olarak transkript et.
     Sadece konuşulan metni yaz, başka hiçbir şey ekleme.
     Eğer videoda konuşma yoksa "Bu videoda konuşma bulunamadı." yaz."""
 
-    response = model.generate_content([video_file, prompt])
-
-    # Dosyayı sil
     try:
-        video_file.delete()
-    except:
-        pass
+        video_part = types.Part.from_uri(file_uri=video_file.uri, mime_type=video_file.mime_type)
+        return await _generate_text('transcribe', [video_part, prompt])
+    finally:
+        # Dosyayı sil
+        await _delete_file(video_file.name)
 
-    return response.text.strip()
 
+async def _translate_whole(text: str, target_language: str) -> str:
+    prompt = f"""Aşağıdaki metni {target_language} diline çevir.
+Sadece çeviriyi yaz, başka hiçbir şey ekleme.
+Eğer metin zaten {target_language} dilindeyse, aynen yaz.
 
-async def translate_text(text: str, target_language: str) -> str:
+Metin:
+{text}"""
+
+    return await _generate_text('translate', prompt)
+
+
+async def translate_text(text: str, target_language: str, source_language: str | None = None,
+                         job_stats: Counter | None = None) -> str:
     """
     Metni belirtilen dile çevirir.
 
+    Metin zaten hedef dildeyse model çağrılmaz. Daha önce çevrilmiş metinler ve
+    cümleler çeviri hafızasından gelir; modele sadece hafızada olmayan cümleler
+    (numaralı tek bir istekle) gönderilir.
+
     Args:
         text: Çevrilecek metin
         target_language: Hedef dil ("Turkish" veya "English")
+        source_language: Biliniyorsa metnin dili (verilmezse yerel olarak tespit edilir)
+        job_stats: Verilirse bu işin tasarruf sayaçları buraya da eklenir
 
     Returns:
         Çevrilmiş metin
@@ -66,25 +275,70 @@ async def translate_text(text: str, target_language: str) -> str:
     if not text or text == "Bu videoda konuşma bulunamadı.":
         return text
 
-    model = genai.GenerativeModel('gemini-2.0-flash')
-
-    prompt = f"""Aşağıdaki metni {target_language} diline çevir.
-Sadece çeviriyi yaz, başka hiçbir şey ekleme.
-Eğer metin zaten {target_language} dilindeyse, aynen yaz.
-
-Metin:
-{text}"""
-
-    response = model.generate_content(prompt)
-    return response.text.strip()
-
+    if source_language is None:
+        source_language = detect_language(text)
+    if source_language == target_language:
+        translation_memory.count(job_stats, same_language_skips=1, saved_calls=1,
+                                 saved_tokens=estimate_tokens(text) * 2)
+        return text
 
-async def process_video(video_path: str) -> dict:
+    cached = translation_memory.get(text, target_language)
+    if cached is not None:
+        translation_memory.count(job_stats, hits=1, saved_calls=1,
+                                 saved_tokens=estimate_tokens(text) + estimate_tokens(cached))
+        return cached
+
+    sentences, separators = split_sentences_with_separators(text)
+    if len(sentences) <= 1:
+        translation = await _translate_whole(text, target_language)
+        translation_memory.count(job_stats, model_calls=1)
+        translation_memory.put(text, target_language, translation)
+        return translation
+
+    # Cümle düzeyinde hafıza: tekrar eden cümleler farklı videolarda da yeniden kullanılır
+    translations = [translation_memory.get(sentence, target_language) for sentence in sentences]
+    missing = [i for i, t in enumerate(translations) if t is None]
+    reused = len(sentences) - len(missing)
+    saved_tokens = sum(estimate_tokens(sentences[i]) + estimate_tokens(translations[i])
+                       for i in range(len(sentences)) if translations[i] is not None)
+
+    if not missing:
+        translation_memory.count(job_stats, phrase_hits=reused, saved_calls=1, saved_tokens=saved_tokens)
+    else:
+        # Cümle içindeki satır sonları tek satıra indirilir; her numara tek satır olmalı
+        numbered = "\n".join(f"{n}. {' '.join(sentences[i].split())}" for n, i in enumerate(missing, start=1))
+        prompt = f"""Aşağıdaki numaralı cümleleri {target_language} diline çevir.
+Her cümlenin çevirisini aynı numarayla, tek satırda yaz; başka hiçbir şey ekleme.
+Cümle zaten {target_language} dilindeyse aynen yaz.
+
+{numbered}"""
+
+        parsed = parse_numbered_lines(await _generate_text('translate', prompt), len(missing))
+        translation_memory.count(job_stats, model_calls=1)
+        if parsed is None:
+            # Numaralar tutmadı: metnin tamamını çevir (cümleler hafızaya alınmaz)
+            translation = await _translate_whole(text, target_language)
+            translation_memory.count(job_stats, model_calls=1)
+            translation_memory.put(text, target_language, translation)
+            return translation
+
+        for i, sentence_translation in zip(missing, parsed):
+            translations[i] = sentence_translation
+            translation_memory.put(sentences[i], target_language, sentence_translation)
+        translation_memory.count(job_stats, phrase_hits=reused, saved_tokens=saved_tokens)
+
+    # Orijinal ayraçlarla (satır sonları dahil) birleştir
+    translation = translations[0] + "".join(sep + t for sep, t in zip(separators, translations[1:]))
+    translation_memory.put(text, target_language, translation)
+    return translation
+
+
+async def process_video(video) -> dict:
     """
-    Video dosyasını işler: transkript çıkarır ve çevirileri yapar.
+    Videoyu işler: transkript çıkarır ve çevirileri yapar.
 
     Args:
-        video_path: Video dosyasının yolu
+        video: Video akışı
 
     Returns:
         dict: {
@@ -94,11 +348,17 @@ async def process_video(video_path: str) -> dict:
         }
     """
     # Transkript çıkar
-    original = await transcribe_video(video_path)
-
-    # Çevirileri yap
-    turkish = await translate_text(original, "Turkish")
-    english = await translate_text(original, "English")
+    original = await transcribe_video(video)
+
+    # Çevirileri yap (dil bir kez tespit edilir, aynı dile çeviri atlanır)
+    source_language = detect_language(original)
+    job_stats = Counter()
+    turkish = await translate_text(original, "Turkish", source_language, job_stats)
+    english = await translate_text(original, "English", source_language, job_stats)
+    logger.info(f"Kaynak dil: {source_language or 'bilinmiyor'}, "
+                f"bu işte tasarruf edilen çeviri çağrısı: {job_stats['saved_calls']}, "
+                f"hafızadan gelen cümle: {job_stats['phrase_hits']}, "
+                f"tahmini token: {job_stats['saved_tokens']}")
 
     return {
         'original': original,
@@ -117,12 +377,12 @@ async def generate_hook_text(transcript: str) -> str:
     Returns:
         2-5 kelimelik hook text
     """
-    model = genai.GenerativeModel('gemini-2.0-flash')
+    excerpt = truncate_to_token_budget(transcript, TRANSCRIPT_TOKEN_BUDGETS['hook'])
 
     prompt = f"""Aşağıdaki video transkriptinden Instagram Reels thumbnail için kısa ve dikkat çekici bir başlık (hook text) oluştur.
 
 Transkript:
-{transcript[:500]}
+{excerpt}
 
 Kurallar:
 1. SADECE 2-5 kelime olmalı
@@ -137,8 +397,7 @@ Kurallar:
 - "FREE TOOLS FOR EVERYTHING"
 - "GOOGLE'S FREE TOOLS ARE INSANE" """
 
-    response = model.generate_content(prompt)
-    return response.text.strip()
+    return await _generate_text('hook', prompt)
 
 
 async def generate_thumbnail_prompt(transcript: str, hook_text: str) -> str:
@@ -152,12 +411,12 @@ async def generate_thumbnail_prompt(transcript: str, hook_text: str) -> str:
     Returns:
         Thumbnail için optimize edilmiş prompt
     """
-    model = genai.GenerativeModel('gemini-2.0-flash')
+    excerpt = truncate_to_token_budget(transcript, TRANSCRIPT_TOKEN_BUDGETS['thumbnail_prompt'])
 
     prompt = f"""Create an Instagram Reels thumbnail image prompt based on this video transcript.
 
 Transcript summary:
-{transcript[:500]}
+{excerpt}
 
 Hook text to display on image: "{hook_text}"
 
@@ -175,12 +434,22 @@ Output ONLY the image generation prompt in English, nothing else.
 
 Example style: "Vibrant pop-art style Instagram Reels thumbnail with bold text '{hook_text}' in large yellow typography, colorful artistic background with [relevant visual], saturated colors, modern social media aesthetic, eye-catching design, 9:16 vertical format" """
 
-    response = model.generate_content(prompt)
-    return response.text.strip()
+    return await _generate_text('thumbnail_prompt', prompt)
 
 
-# Sabit thumbnail input görseli
+# Sabit thumbnail input görseli (bir kez okunur)
 THUMBNAIL_BASE_IMAGE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'thumbnail_base.jpg')
+with open(THUMBNAIL_BASE_IMAGE, 'rb') as f:
+    THUMBNAIL_BASE_PART = types.Part.from_bytes(data=f.read(), mime_type="image/jpeg")
+
+# Görsel üretim ayarları (her çağrıda yeniden oluşturulmaz)
+THUMBNAIL_IMAGE_CONFIG = types.GenerateContentConfig(
+    response_modalities=['TEXT', 'IMAGE'],
+    image_config=types.ImageConfig(
+        aspect_ratio="9:16",
+        image_size="2K"
+    )
+)
 
 
 async def generate_topic_summary(transcript: str) -> str:
@@ -193,13 +462,13 @@ async def generate_topic_summary(transcript: str) -> str:
     Returns:
         Kısa konu özeti (1-2 cümle)
     """
-    model = genai.GenerativeModel('gemini-2.0-flash')
+    excerpt = truncate_to_token_budget(transcript, TRANSCRIPT_TOKEN_BUDGETS['topic'])
 
     prompt = f"""Aşağıdaki video transkriptinin konusunu 1-2 cümleyle özetle.
 Sadece konuyu yaz, başka bir şey ekleme.
 
 Transkript:
-{transcript[:800]}
+{excerpt}
 
 Örnek çıktılar:
 - "Python programlama eğitimi ve temel kodlama teknikleri"
@@ -207,34 +476,32 @@ Transkript:
 - "Instagram'da viral olmanın sırları"
 - "Kişisel gelişim ve motivasyon tavsiyeleri" """
 
-    response = model.generate_content(prompt)
-    return response.text.strip()
+    return await _generate_text('topic', prompt)
 
 
-async def generate_thumbnail(video_path: str) -> tuple[bytes, str, str]:
+async def generate_thumbnail(video) -> tuple[bytes, str, str]:
     """
     Sabit görsel üzerine transkripte göre thumbnail oluşturur (image-to-image).
 
     Args:
-        video_path: Video dosyasının yolu (sadece transkript için)
+        video: Video akışı (sadece transkript için)
 
     Returns:
         tuple: (PNG formatında görsel bytes, hook_text, transcript)
     """
     # Transkript çıkar (konuyu anlamak için)
-    transcript = await transcribe_video(video_path)
+    transcript = await transcribe_video(video)
 
     # Hook text ve konu özeti oluştur
     if transcript == "Bu videoda konuşma bulunamadı.":
         hook_text = "WATCH THIS"
         topic_summary = "General content"
     else:
-        hook_text = await generate_hook_text(transcript)
-        topic_summary = await generate_topic_summary(transcript)
-
-    # Sabit görseli oku
-    with open(THUMBNAIL_BASE_IMAGE, 'rb') as f:
-        base_image_bytes = f.read()
+        # Birbirinden bağımsız oldukları için eşzamanlı istenir
+        hook_text, topic_summary = await asyncio.gather(
+            generate_hook_text(transcript),
+            generate_topic_summary(transcript),
+        )
 
     # Image-to-image prompt oluştur (transkript konusu dahil)
     edit_prompt = f"""Transform this image into a professional Instagram Reels thumbnail.
@@ -258,24 +525,27 @@ IMPORTANT: Background must be plain dark/black. Feel free to make the person loo
 TEXT TO DISPLAY: "{hook_text}" """
 
     # Nano Banana Pro (Gemini 3 Pro Image) ile image-to-image düzenleme yap
-    response = genai_client.models.generate_content(
-        model="gemini-3-pro-image-preview",
-        contents=[
-            types.Part.from_bytes(data=base_image_bytes, mime_type="image/jpeg"),
-            edit_prompt
-        ],
-        config=types.GenerateContentConfig(
-            response_modalities=['TEXT', 'IMAGE'],
-            image_config=types.ImageConfig(
-                aspect_ratio="9:16",
-                image_size="2K"
-            )
-        ),
-    )
-
-    # Görseli bytes olarak al
-    for part in response.candidates[0].content.parts:
-        if part.inline_data is not None:
-            return (part.inline_data.data, hook_text, transcript)
-
-    raise ValueError("Görsel oluşturulamadı.")
+    # (başarısız olursa politika sıradaki görsel modeline geçer)
+    async def request(model_name: str) -> bytes:
+        response = await genai_client.aio.models.generate_content(
+            model=model_name,
+            contents=[THUMBNAIL_BASE_PART, edit_prompt],
+            config=THUMBNAIL_IMAGE_CONFIG,
+        )
+
+        # Görseli bytes olarak al (engellenen yanıtta aday veya içerik boş olabilir)
+        candidate = response.candidates[0] if response.candidates else None
+        parts = candidate.content.parts if candidate and candidate.content else None
+        for part in parts or []:
+            if part.inline_data is not None:
+                usage_ledger.record(response.usage_metadata, images=1)
+                return part.inline_data.data
+
+        usage_ledger.record(response.usage_metadata)
+
+        # Sadece metin veya güvenlik yanıtı: aynı model tekrar denenmez, sıradaki görsel modeline geçilir
+        raise TryNextModel("Görsel oluşturulamadı.")
+
+    await _discover_models()
+    image_bytes = await router.run('image', request)
+    return (image_bytes, hook_text, transcript)
@@ -0,0 +1,34 @@
+import httpx
+
+from config import HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS, HTTP_TIMEOUT
+
+# Bağlantı havuzu ayarları; Instagram CDN indirmeleri, Gemini dosya yüklemeleri
+# ve Gemini client'ı aynı havuzu (ve sınırları) paylaşır
+HTTP_LIMITS = httpx.Limits(
+    max_connections=HTTP_MAX_CONNECTIONS,
+    max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry=60,
+)
+HTTP_TIMEOUTS = httpx.Timeout(HTTP_TIMEOUT, connect=10)
+
+_http_client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Tüm eşzamanlı işlerin paylaştığı, bağlantıları yeniden kullanan HTTP client'ı döndürür."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUTS, follow_redirects=True)
+    return _http_client
+
+
+async def close_http_client():
+    """
+    Uygulama kapanırken havuzdaki bağlantıları kapatır.
+
+    Gemini client'ı da bu havuzu kullandığı için sadece kapanışta çağrılmalıdır.
+    """
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
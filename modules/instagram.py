@@ -1,9 +1,13 @@
 import os
 import re
-import tempfile
+import asyncio
+import threading
+import contextlib
+import httpx
 import instaloader
 
 from config import INSTAGRAM_USERNAME, INSTAGRAM_PASSWORD
+from modules.http_client import get_http_client
 
 
 def is_instagram_url(url: str) -> bool:
@@ -17,19 +21,29 @@ def is_instagram_url(url: str) -> bool:
     return any(re.match(pattern, url) for pattern in patterns)
 
 
-def extract_instagram_url(text: str) -> str | None:
-    """Metin içinden Instagram URL'sini çıkarır."""
-    patterns = [
-        r'https?://(www\.)?instagram\.com/p/[\w-]+/?(\?[^\s]*)?',
-        r'https?://(www\.)?instagram\.com/reel/[\w-]+/?(\?[^\s]*)?',
-        r'https?://(www\.)?instagram\.com/reels/[\w-]+/?(\?[^\s]*)?',
-        r'https?://(www\.)?instagram\.com/tv/[\w-]+/?(\?[^\s]*)?',
-    ]
-    for pattern in patterns:
-        match = re.search(pattern, text)
-        if match:
-            return match.group(0)
-    return None
+def extract_instagram_urls(text: str) -> list[str]:
+    """Metin içindeki tüm Instagram URL'lerini (aynı post'u bir kez) sırasıyla çıkarır."""
+    pattern = r'https?://(?:www\.)?instagram\.com/(?:p|reel|reels|tv)/[\w-]+/?(?:\?[^\s]*)?'
+    urls = []
+    seen = set()
+    for match in re.finditer(pattern, text):
+        shortcode = extract_shortcode(match.group(0))
+        if shortcode not in seen:
+            seen.add(shortcode)
+            urls.append(match.group(0))
+    return urls
+
+
+def extract_username(text: str) -> str | None:
+    """Profil linki veya @kullanıcı adından Instagram kullanıcı adını çıkarır."""
+    text = text.strip()
+    if 'instagram.com/' in text:
+        match = re.search(r'instagram\.com/([A-Za-z0-9._]{1,30})', text)
+    else:
+        match = re.fullmatch(r'@?([A-Za-z0-9._]{1,30})', text)
+    if not match or match.group(1) in ('p', 'reel', 'reels', 'tv', 'stories'):
+        return None
+    return match.group(1)
 
 
 def extract_shortcode(url: str) -> str:
@@ -42,129 +56,216 @@ def extract_shortcode(url: str) -> str:
     return None
 
 
-async def download_video(url: str) -> tuple[str, str]:
+USER_AGENT = "Mozilla/5.0 (iPhone; CPU iPhone OS 15_5 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148 Instagram 239.2.0.12.109 (iPhone12,1; iOS 15_5; en_US; en-US; scale=2.00; 828x1792; 376668393)"
+SESSION_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'instagram_session')
+
+
+def _create_loader() -> instaloader.Instaloader:
+    """Ortak ayarlarla Instaloader instance oluşturur."""
+    return instaloader.Instaloader(
+        download_videos=True,
+        download_video_thumbnails=False,
+        download_geotags=False,
+        download_comments=False,
+        save_metadata=False,
+        compress_json=False,
+        filename_pattern='{shortcode}',
+        user_agent=USER_AGENT
+    )
+
+
+def _login_to_instagram(L: instaloader.Instaloader):
+    """Varsa session dosyasıyla, yoksa kullanıcı adı/şifre ile giriş yapar."""
+    if INSTAGRAM_USERNAME and INSTAGRAM_PASSWORD:
+        try:
+            # Önce session dosyasını dene
+            if os.path.exists(SESSION_FILE):
+                try:
+                    L.load_session_from_file(INSTAGRAM_USERNAME, SESSION_FILE)
+                    print("Session yüklendi.")
+                except Exception as e:
+                    print(f"Session yüklenirken hata: {e}")
+                    L.login(INSTAGRAM_USERNAME, INSTAGRAM_PASSWORD)
+            else:
+                print("Session dosyası yok, yeni giriş yapılıyor...")
+                L.login(INSTAGRAM_USERNAME, INSTAGRAM_PASSWORD)
+
+            # Başarılı giriş sonrası session kaydet
+            L.save_session_to_file(filename=SESSION_FILE)
+
+        except Exception as login_error:
+            print(f"Login hatası: {login_error}")
+            # Login başarısız olsa da devam et (anonim deneme)
+            pass
+
+
+def _remove_session_file():
+    """Kayıtlı session dosyasını siler (başka bir iş zaten sildiyse sorun değil)."""
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(SESSION_FILE)
+
+
+class InstagramSession:
     """
-    Instagram videosunu indirir.
+    Giriş yapılmış Instaloader oturumu; toplu işlerde tüm öğeler paylaşır.
 
-    Returns:
-        tuple: (video_path, temp_dir) - Video dosyası yolu ve geçici klasör
+    Oturumun süresi dolarsa (401) yenileme kilit altında bir kez yapılır;
+    aynı anda hata alan diğer işler yenilenmiş oturumu kullanır.
+    """
 
-    Raises:
-        Exception: İndirme başarısız olursa
+    def __init__(self, loader: instaloader.Instaloader):
+        self.loader = loader
+        self._lock = threading.Lock()
+
+    def refresh(self, stale: instaloader.Instaloader) -> instaloader.Instaloader:
+        """`stale` hâlâ güncel oturumsa session'ı silip yeniden giriş yapar."""
+        with self._lock:
+            if self.loader is stale:
+                _remove_session_file()
+
+                # Yeni temiz instance, tekrar login (session dosyası olmadığı için taze login yapacak)
+                L = _create_loader()
+                _login_to_instagram(L)
+                self.loader = L
+            return self.loader
+
+
+def create_session() -> InstagramSession:
+    """Giriş yapılmış, paylaşılabilir bir Instagram oturumu oluşturur (bloklayan çağrı)."""
+    L = _create_loader()
+    _login_to_instagram(L)
+    return InstagramSession(L)
+
+
+def _fetch_post(url: str, session: InstagramSession) -> instaloader.Post:
     """
-    temp_dir = tempfile.mkdtemp()
-    session_file = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'instagram_session')
+    URL'deki post'u getirir; 401 benzeri hatalarda oturumu yenileyip bir kez daha dener.
+    """
+    # Shortcode'u çıkar
+    shortcode = extract_shortcode(url)
+    if not shortcode:
+        raise Exception("Geçersiz Instagram URL'si")
 
+    L = session.loader
     try:
-        # Instaloader instance oluştur
-        L = instaloader.Instaloader(
-            download_videos=True,
-            download_video_thumbnails=False,
-            download_geotags=False,
-            download_comments=False,
-            save_metadata=False,
-            compress_json=False,
-            dirname_pattern=temp_dir,
-            filename_pattern='{shortcode}',
-            user_agent="Mozilla/5.0 (iPhone; CPU iPhone OS 15_5 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148 Instagram 239.2.0.12.109 (iPhone12,1; iOS 15_5; en_US; en-US; scale=2.00; 828x1792; 376668393)"
-        )
+        return instaloader.Post.from_shortcode(L.context, shortcode)
+    except (instaloader.ConnectionException, instaloader.QueryReturnedNotFoundException, instaloader.LoginRequiredException) as e:
+        # 401 veya benzeri hatalarda session'ı yenileyip tekrar dene
+        error_str = str(e)
+        if "401" in error_str or "fail" in error_str or isinstance(e, instaloader.LoginRequiredException):
+            print(f"Hata alındı ({error_str}), session yenilenip tekrar deneniyor...")
+            L = session.refresh(L)
+            return instaloader.Post.from_shortcode(L.context, shortcode)
+        raise e
 
-        def login_to_instagram():
-            if INSTAGRAM_USERNAME and INSTAGRAM_PASSWORD:
-                try:
-                    # Önce session dosyasını dene
-                    if os.path.exists(session_file):
-                        try:
-                            L.load_session_from_file(INSTAGRAM_USERNAME, session_file)
-                            print("Session yüklendi.")
-                        except Exception as e:
-                            print(f"Session yüklenirken hata: {e}")
-                            L.login(INSTAGRAM_USERNAME, INSTAGRAM_PASSWORD)
-                    else:
-                        print("Session dosyası yok, yeni giriş yapılıyor...")
-                        L.login(INSTAGRAM_USERNAME, INSTAGRAM_PASSWORD)
-                    
-                    # Başarılı giriş sonrası session kaydet
-                    L.save_session_to_file(filename=session_file)
-                    
-                except Exception as login_error:
-                    print(f"Login hatası: {login_error}")
-                    # Login başarısız olsa da devam et (anonim deneme)
-                    pass
-
-        # İlk deneme
-        login_to_instagram()
-
-        # Shortcode'u çıkar
-        shortcode = extract_shortcode(url)
-        if not shortcode:
-            raise Exception("Geçersiz Instagram URL'si")
 
-        try:
-            # Post'u indir
-            post = instaloader.Post.from_shortcode(L.context, shortcode)
-            L.download_post(post, target=temp_dir)
-        except (instaloader.ConnectionException, instaloader.QueryReturnedNotFoundException, instaloader.LoginRequiredException) as e:
-            # 401 veya benzeri hatalarda session'ı silip tekrar dene
-            error_str = str(e)
-            if "401" in error_str or "fail" in error_str or isinstance(e, instaloader.LoginRequiredException):
-                print(f"Hata alındı ({error_str}), session silinip tekrar deneniyor...")
-                if os.path.exists(session_file):
-                    os.remove(session_file)
-                
-                # Yeni temiz instance
-                L = instaloader.Instaloader(
-                    download_videos=True,
-                    download_video_thumbnails=False,
-                    download_geotags=False,
-                    download_comments=False,
-                    save_metadata=False,
-                    compress_json=False,
-                    dirname_pattern=temp_dir,
-                    filename_pattern='{shortcode}',
-                    user_agent="Mozilla/5.0 (iPhone; CPU iPhone OS 15_5 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148 Instagram 239.2.0.12.109 (iPhone12,1; iOS 15_5; en_US; en-US; scale=2.00; 828x1792; 376668393)"
-                )
-                # Tekrar login (session dosyası olmadığı için taze login yapacak)
-                login_to_instagram()
-                
-                # Tekrar indir
-                post = instaloader.Post.from_shortcode(L.context, shortcode)
-                L.download_post(post, target=temp_dir)
-            else:
-                raise e
+class VideoStream:
+    """
+    Instagram CDN'inden akan video yanıtı.
 
-        # Video dosyasını bul
-        video_path = None
-        for f in os.listdir(temp_dir):
-            if f.endswith('.mp4'):
-                video_path = os.path.join(temp_dir, f)
-                break
+    Video diske yazılmaz; `iter_chunks` sabit boyutlu parçalar üretir,
+    böylece bellek kullanımı parça boyutuyla sınırlı kalır.
+    """
+
+    mime_type = "video/mp4"
+
+    def __init__(self, response: httpx.Response, shortcode: str):
+        self._response = response
+        self.shortcode = shortcode
+        # Baytlar olduğu gibi (aiter_raw) aktarılır; Content-Length ancak içerik
+        # kodlanmamışsa gönderilen bayt sayısına eşittir
+        encoding = response.headers.get('Content-Encoding', 'identity').lower()
+        self._raw = encoding == 'identity'
+        length = response.headers.get('Content-Length')
+        self.size = int(length) if length and self._raw else None
+
+    async def iter_chunks(self, chunk_size: int):
+        """Videoyu `chunk_size` boyutunda parçalar halinde üretir (sonuncusu daha kısa olabilir)."""
+        buffer = bytearray()
+        # CDN yine de sıkıştırırsa çözülmüş video gönderilir (boyut bildirilmeden)
+        stream = self._response.aiter_raw() if self._raw else self._response.aiter_bytes()
+        async for data in stream:
+            buffer.extend(data)
+            while len(buffer) >= chunk_size:
+                yield bytes(buffer[:chunk_size])
+                del buffer[:chunk_size]
+        if buffer:
+            yield bytes(buffer)
+
+    async def aclose(self):
+        """Bağlantıyı havuza geri bırakır."""
+        await self._response.aclose()
 
-        if not video_path:
-            raise Exception("Video dosyası bulunamadı")
 
-        return video_path, temp_dir
+async def open_video_stream(url: str, session: InstagramSession | None = None) -> VideoStream:
+    """
+    Instagram videosunu diske indirmeden akış olarak açar.
+
+    Post bilgisi instaloader ile alınır; video ise ortak HTTP havuzu üzerinden
+    asenkron olarak akıtılır.
+
+    Args:
+        url: Instagram post/reel linki
+        session: Toplu işlerde paylaşılan Instagram oturumu (verilmezse yenisi açılır)
+
+    Returns:
+        VideoStream: Parça parça okunabilen video akışı (kullanım sonrası `aclose()` çağrılmalı)
+
+    Raises:
+        Exception: Post alınamazsa veya video değilse
+    """
+    try:
+        if session is None:
+            session = await asyncio.to_thread(create_session)
+        post = await asyncio.to_thread(_fetch_post, url, session)
+        if not post.is_video or not post.video_url:
+            raise Exception("Bu post bir video değil")
+
+        client = get_http_client()
+        # Sıkıştırma istenmez: video zaten sıkıştırılmış, baytlar olduğu gibi yüklenir
+        request = client.build_request(
+            'GET', post.video_url, headers={'User-Agent': USER_AGENT, 'Accept-Encoding': 'identity'},
+        )
+        response = await client.send(request, stream=True)
+        if response.is_error:
+            await response.aclose()
+            raise Exception(f"CDN yanıtı {response.status_code}")
+        return VideoStream(response, post.shortcode)
 
     except instaloader.exceptions.LoginRequiredException:
-        cleanup(temp_dir)
         raise Exception("Bu video için login gerekiyor")
     except instaloader.exceptions.PrivateProfileNotFollowedException:
-        cleanup(temp_dir)
         raise Exception("Bu profil gizli")
     except Exception as e:
-        cleanup(temp_dir)
         raise Exception(f"Video indirilemedi: {str(e)}")
 
 
-def cleanup(temp_dir: str):
-    """Geçici dosyaları temizler."""
-    if os.path.exists(temp_dir):
-        for f in os.listdir(temp_dir):
-            try:
-                os.remove(os.path.join(temp_dir, f))
-            except:
-                pass
-        try:
-            os.rmdir(temp_dir)
-        except:
-            pass
+def _profile_reel_urls(L: instaloader.Instaloader, username: str, count: int) -> list[str]:
+    profile = instaloader.Profile.from_username(L.context, username)
+    urls = []
+    for post in profile.get_posts():
+        if post.is_video:
+            urls.append(f"https://www.instagram.com/reel/{post.shortcode}/")
+            if len(urls) >= count:
+                break
+    return urls
+
+
+async def get_profile_reel_urls(username: str, count: int,
+                                session: InstagramSession | None = None) -> list[str]:
+    """
+    Profilin en son `count` video/reel linkini döndürür.
+
+    Raises:
+        Exception: Profil bulunamazsa veya gizliyse
+    """
+    try:
+        if session is None:
+            session = await asyncio.to_thread(create_session)
+        return await asyncio.to_thread(_profile_reel_urls, session.loader, username, count)
+    except instaloader.exceptions.ProfileNotExistsException:
+        raise Exception("Profil bulunamadı (not found)")
+    except instaloader.exceptions.PrivateProfileNotFollowedException:
+        raise Exception("Bu profil gizli (private)")
+    except instaloader.exceptions.LoginRequiredException:
+        raise Exception("Bu profil için login gerekiyor (login required)")
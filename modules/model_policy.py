@@ -0,0 +1,230 @@
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass
+class StagePolicy:
+    """Bir işlem aşaması (transkript, çeviri, görsel...) için çağrı politikası."""
+
+    models: list[str]              # Sıralı model listesi (ilki birincil, diğerleri yedek)
+    deadline: float = 60.0         # Aşamanın toplam süre sınırı (saniye)
+    attempt_timeout: float = 30.0  # Tek denemenin süre sınırı (saniye)
+    max_retries: int = 1           # Model başına ek deneme sayısı
+    backoff: float = 0.5           # Yeniden deneme bekleme tabanı (saniye, jitter'lı)
+    hedge: bool = False            # Gecikirse ikinci (yedek) istek gönderilsin mi
+    hedge_delay: float = 5.0       # Yeterli ölçüm yokken kullanılan hedge gecikmesi
+
+
+class TryNextModel(Exception):
+    """
+    Aynı modelle tekrar denemenin sonucu değiştirmeyeceği ama sıradaki modelin
+    başarabileceği hata (ör. görsel yerine sadece metin dönen yanıt).
+
+    Yeniden denenmez ve devre kesiciye sayılmaz; doğrudan yedek modele geçilir.
+    """
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Sadece geçici hatalar yeniden denenir: zaman aşımı, bağlantı hatası, 429 ve 5xx.
+
+    Geçersiz istek (4xx), engellenmiş yanıt veya görsel üretilememesi gibi hatalar
+    başka denemede de değişmeyeceği için hemen yükseltilir.
+    """
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, 'code', None) or getattr(error, 'status_code', None)
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+
+class LatencyTracker:
+    """Model başına son gecikmeleri tutar ve yüzdelik değer hesaplar."""
+
+    def __init__(self, window: int = 100, min_samples: int = 10):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: dict[str, deque] = {}
+
+    def record(self, model: str, seconds: float):
+        self._samples.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, model: str, pct: float = 0.95) -> float | None:
+        """Yeterli ölçüm yoksa None döndürür."""
+        samples = self._samples.get(model)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * pct))
+        return ordered[index]
+
+
+class CircuitBreaker:
+    """
+    Art arda hata veren modelleri bir süreliğine devre dışı bırakır.
+
+    Bekleme süresi dolunca model tekrar denenir (half-open); yine hata verirse
+    devre hemen tekrar açılır.
+    """
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 60.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self._failures: dict[str, int] = {}
+        self._opened_at: dict[str, float] = {}
+
+    def is_open(self, model: str) -> bool:
+        opened_at = self._opened_at.get(model)
+        if opened_at is None:
+            return False
+        return self.clock() - opened_at < self.cooldown
+
+    def record_success(self, model: str):
+        self._failures.pop(model, None)
+        self._opened_at.pop(model, None)
+
+    def record_failure(self, model: str):
+        failures = self._failures.get(model, 0) + 1
+        self._failures[model] = failures
+        if failures >= self.failure_threshold:
+            if not self.is_open(model):
+                logger.warning(f"Devre açıldı: {model} ({failures} art arda hata)")
+            self._opened_at[model] = self.clock()
+
+
+class ModelRouter:
+    """
+    Gemini çağrılarını aşama politikalarına göre yürütür: süre sınırı, jitter'lı
+    yeniden deneme, p95 gecikmesine göre hedge isteği, yedek modeller ve devre kesici.
+
+    Çağrının kendisi `request(model_name)` coroutine fonksiyonu olarak verilir;
+    testlerde gecikme ekleyen sahte bir fonksiyon kullanılabilir.
+    """
+
+    def __init__(
+        self,
+        policies: dict[str, StagePolicy],
+        available_models: Callable[[], set[str] | None] | None = None,
+        breaker: CircuitBreaker | None = None,
+        latency: LatencyTracker | None = None,
+        clock=time.monotonic,
+        retryable: Callable[[BaseException], bool] = is_retryable,
+    ):
+        self.policies = policies
+        self.retryable = retryable
+        self.available_models = available_models
+        self.breaker = breaker or CircuitBreaker(clock=clock)
+        self.latency = latency or LatencyTracker()
+        self.clock = clock
+        # Gönderilen hedge isteği sayısı (kaybeden istekler kullanım kaydına düşmez)
+        self.hedged_requests = 0
+
+    def candidates(self, stage: str) -> list[str]:
+        """Aşama için denenecek modelleri sırasıyla döndürür."""
+        models = self.policies[stage].models
+
+        available = self.available_models() if self.available_models else None
+        if available:
+            discovered = [m for m in models if m in available]
+            # Hiçbiri keşfedilemediyse listeyi olduğu gibi kullan
+            models = discovered or models
+
+        closed = [m for m in models if not self.breaker.is_open(m)]
+        # Tüm devreler açıksa yine de en iyi ihtimalle dene
+        return closed or models
+
+    async def run(self, stage: str, request: Callable[[str], Awaitable[T]]) -> T:
+        """
+        `request` çağrısını aşama politikasına göre çalıştırır.
+
+        Sadece geçici hatalar yeniden denenir, yedek modele geçirilir ve devre
+        kesiciye sayılır. TryNextModel beklemeden sıradaki modele geçirir; diğer
+        hatalar hemen yükseltilir.
+
+        Raises:
+            TimeoutError: Aşama süresi dolarsa
+            Exception: Kalıcı hata veya tüm modeller ve denemeler başarısız olursa son hata
+        """
+        policy = self.policies[stage]
+        deadline = self.clock() + policy.deadline
+        last_error = None
+
+        for model in self.candidates(stage):
+            for attempt in range(policy.max_retries + 1):
+                remaining = deadline - self.clock()
+                if remaining <= 0:
+                    raise TimeoutError(f"{stage} süre sınırı aşıldı") from last_error
+
+                try:
+                    return await asyncio.wait_for(
+                        self._attempt(model, policy, request),
+                        timeout=min(remaining, policy.attempt_timeout),
+                    )
+                except asyncio.CancelledError:
+                    raise
+                except TryNextModel as e:
+                    last_error = e
+                    logger.warning(f"{stage} / {model} sonuç vermedi, sıradaki modele geçiliyor: {e}")
+                    break
+                except Exception as e:
+                    if not self.retryable(e):
+                        raise
+                    last_error = e
+                    self.breaker.record_failure(model)
+                    logger.warning(f"{stage} / {model} deneme {attempt + 1} başarısız: {e!r}")
+
+                    if self.breaker.is_open(model) or attempt == policy.max_retries:
+                        break
+
+                    # Üstel bekleme + tam jitter, kalan süreyi aşmadan
+                    delay = random.uniform(0, policy.backoff * (2 ** attempt))
+                    await asyncio.sleep(min(delay, max(0.0, deadline - self.clock())))
+
+        if last_error is None:
+            raise RuntimeError(f"{stage} için kullanılabilir model yok")
+        raise last_error
+
+    async def _attempt(self, model: str, policy: StagePolicy, request: Callable[[str], Awaitable[T]]) -> T:
+        """Tek deneme; gerekirse p95 gecikmesinden sonra ikinci bir istek yarıştırır."""
+        primary = asyncio.ensure_future(request(model))
+        tasks = {primary}
+        # Gecikme kazanan isteğin kendi başlangıcından ölçülür; hedge beklemesi
+        # p95'e eklenirse hedge gecikmesi giderek büyür
+        started = {primary: self.clock()}
+
+        try:
+            if policy.hedge:
+                hedge_delay = self.latency.percentile(model) or policy.hedge_delay
+                done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+                if not done:
+                    logger.info(f"{model} {hedge_delay:.1f}s içinde yanıt vermedi, hedge isteği gönderiliyor")
+                    hedge = asyncio.ensure_future(request(model))
+                    tasks.add(hedge)
+                    started[hedge] = self.clock()
+                    self.hedged_requests += 1
+
+            last_error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.latency.record(model, self.clock() - started[task])
+                        self.breaker.record_success(model)
+                        return task.result()
+                    last_error = task.exception()
+                    # Kalıcı hata hedge isteğinde de değişmez; beklemeden yükselt
+                    if not self.retryable(last_error):
+                        raise last_error
+            raise last_error
+        finally:
+            for task in tasks:
+                task.cancel()
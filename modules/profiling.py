@@ -0,0 +1,259 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+import tracemalloc
+from collections import Counter
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class SamplingProfiler:
+    """
+    Tüm thread'lerin yığınlarını belirli aralıklarla örnekleyen basit profiler.
+
+    Çıktı flamegraph araçlarının (speedscope, flamegraph.pl) okuyabildiği
+    "collapsed stack" formatındadır.
+    """
+
+    # Kendi yardımcı thread'lerimiz örneklenmez
+    IGNORED_THREADS = {"sampling-profiler", "loop-stall-monitor"}
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        return self.samples
+
+    def _run(self):
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if names.get(thread_id) in self.IGNORED_THREADS:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def top_functions(self, limit: int = 30) -> list[tuple[str, int]]:
+        """En çok örneklenen (self time) fonksiyonları döndürür."""
+        leaf = Counter()
+        for stack, count in self.samples.items():
+            leaf[stack.rsplit(";", 1)[-1]] += count
+        return leaf.most_common(limit)
+
+
+class JobProfiler:
+    """
+    Sıradaki N işi örnekleyici profiler ve tracemalloc altında çalıştırır,
+    sonuçları PROFILE_DIR altına dosya olarak yazar.
+    """
+
+    def __init__(self, output_dir: str, sample_interval: float = 0.005, jobs: int = 0):
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval
+        self.remaining = jobs
+        self._lock = threading.Lock()
+        self._tracing_jobs = 0
+        self._owns_tracing = False
+
+    def arm(self, jobs: int):
+        """Sıradaki `jobs` işin profillenmesini sağlar."""
+        with self._lock:
+            self.remaining = jobs
+
+    def _take_slot(self) -> bool:
+        with self._lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+    def _start_tracing(self):
+        """tracemalloc'u ilk profillenen iş başlatır; eşzamanlı işler paylaşır."""
+        with self._lock:
+            if self._tracing_jobs == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._owns_tracing = True
+            self._tracing_jobs += 1
+
+    def _stop_tracing(self):
+        """Son profillenen iş bitince (ve biz başlattıysak) tracemalloc'u durdurur."""
+        with self._lock:
+            self._tracing_jobs -= 1
+            if self._tracing_jobs == 0 and self._owns_tracing:
+                tracemalloc.stop()
+                self._owns_tracing = False
+
+    @asynccontextmanager
+    async def job(self, name: str):
+        """
+        Profil hakkı varsa işi profiller; yoksa hiçbir şey yapmaz.
+
+        Profil tarafındaki hatalar sadece loglanır; işin sonucunu veya hatasını
+        asla değiştirmez.
+        """
+        if not self._take_slot():
+            yield
+            return
+
+        profiler = SamplingProfiler(self.sample_interval)
+        before = None
+        tracing = False
+        try:
+            self._start_tracing()
+            tracing = True
+            before = tracemalloc.take_snapshot()
+            started = time.perf_counter()
+            cpu_started = time.process_time()
+            profiler.start()
+        except Exception as e:
+            logger.warning(f"Profil başlatılamadı: {e}")
+
+        try:
+            yield
+        finally:
+            try:
+                profiler.stop()
+                if before is not None:
+                    wall = time.perf_counter() - started
+                    cpu = time.process_time() - cpu_started
+                    after = tracemalloc.take_snapshot()
+                    current, peak = tracemalloc.get_traced_memory()
+                    await asyncio.to_thread(self._write, name, profiler, before, after, wall, cpu, peak)
+            except Exception as e:
+                logger.warning(f"Profil yazılamadı: {e}")
+            finally:
+                if tracing:
+                    self._stop_tracing()
+
+    def _write(self, name, profiler, before, after, wall, cpu, peak):
+        os.makedirs(self.output_dir, exist_ok=True)
+        prefix = os.path.join(self.output_dir, f"{datetime.now():%Y%m%d-%H%M%S}_{name}")
+
+        with open(f"{prefix}.collapsed", 'w', encoding='utf-8') as f:
+            for stack, count in profiler.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+        with open(f"{prefix}.txt", 'w', encoding='utf-8') as f:
+            f.write(f"İş: {name}\n")
+            f.write(f"Süre: {wall:.2f}s, CPU: {cpu:.2f}s (bekleme ~{max(0.0, wall - cpu):.2f}s)\n")
+            f.write(f"Bellek tepe noktası: {peak / 1024 / 1024:.1f} MB\n\n")
+            f.write("En çok örneklenen fonksiyonlar:\n")
+            for function, count in profiler.top_functions():
+                f.write(f"{count:6d}  {function}\n")
+            f.write("\nEn çok bellek ayıran satırlar:\n")
+            for stat in after.compare_to(before, 'lineno')[:30]:
+                f.write(f"{stat}\n")
+
+        logger.info(f"Profil yazıldı: {prefix}.txt ({wall:.2f}s, CPU {cpu:.2f}s)")
+
+    def latest_files(self) -> list[str]:
+        """En son yazılan profilin dosyalarını (.txt ve .collapsed) döndürür."""
+        if not os.path.isdir(self.output_dir):
+            return []
+        summaries = [
+            os.path.join(self.output_dir, f) for f in os.listdir(self.output_dir) if f.endswith('.txt')
+        ]
+        if not summaries:
+            return []
+        prefix = max(summaries, key=os.path.getmtime).removesuffix('.txt')
+        return [path for path in (f"{prefix}.txt", f"{prefix}.collapsed") if os.path.exists(path)]
+
+
+class LoopStallMonitor:
+    """
+    Event loop'un eşik süresinden uzun bloklandığını tespit eder ve o anki
+    yığını loglar (ör. event loop içinde senkron I/O veya ağır CPU işi).
+    """
+
+    # Log dosyası bu boyutu aşınca ".1" olarak döndürülür (tek yedek tutulur)
+    MAX_LOG_BYTES = 1024 * 1024
+
+    def __init__(self, threshold: float = 0.5, output_file: str | None = None):
+        self.threshold = threshold
+        self.output_file = output_file
+        self._last_beat = time.monotonic()
+        self._loop_thread_id = None
+        self._stop = threading.Event()
+        self._heartbeat_task = None
+        self._thread = None
+
+    async def _heartbeat(self):
+        self._loop_thread_id = threading.get_ident()
+        interval = self.threshold / 4
+        while not self._stop.is_set():
+            self._last_beat = time.monotonic()
+            await asyncio.sleep(interval)
+
+    def _report(self, message: str):
+        logger.warning(message)
+        if self.output_file:
+            try:
+                if os.path.exists(self.output_file) and os.path.getsize(self.output_file) > self.MAX_LOG_BYTES:
+                    os.replace(self.output_file, self.output_file + ".1")
+                with open(self.output_file, 'a', encoding='utf-8') as f:
+                    f.write(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] {message}\n")
+            except Exception as e:
+                logger.warning(f"Stall kaydı yazılamadı: {e}")
+
+    def _watch(self):
+        reported_beat = None
+        while not self._stop.wait(self.threshold / 4):
+            beat = self._last_beat
+
+            # Raporlanan takılma bittiyse toplam süreyi yaz
+            if reported_beat is not None and beat != reported_beat:
+                self._report(f"Event loop takılması bitti: toplam ~{beat - reported_beat:.2f}s")
+                reported_beat = None
+
+            stalled_for = time.monotonic() - beat
+            if stalled_for < self.threshold or beat == reported_beat or self._loop_thread_id is None:
+                continue
+            reported_beat = beat
+
+            # Yığın takılma sürerken alınır; bloklayan kod tam olarak burada görünür
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "(yığın alınamadı)"
+            self._report(f"Event loop {stalled_for:.2f}s'den uzun süredir bloklu:\n{stack}")
+
+    def start(self):
+        """Çalışan event loop içinden çağrılmalıdır."""
+        if self.output_file:
+            os.makedirs(os.path.dirname(self.output_file), exist_ok=True)
+        self._stop.clear()
+        self._heartbeat_task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-stall-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """İzleyici thread'i ve heartbeat task'ını durdurur."""
+        self._stop.set()
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        if self._thread:
+            self._thread.join()
+            self._thread = None
@@ -1,14 +1,44 @@
 import logging
 import io
+import os
+import asyncio
+import zipfile
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
 
-from config import TELEGRAM_BOT_TOKEN
-from modules.instagram import extract_instagram_url, download_video, cleanup
-from modules.gemini_service import process_video, generate_thumbnail
+from config import (
+    TELEGRAM_BOT_TOKEN, ADMIN_USER_IDS, PROFILE_NEXT_JOBS, PROFILE_DIR, PROFILE_SAMPLE_INTERVAL, LOOP_STALL_THRESHOLD,
+    BATCH_MAX_ITEMS, MAX_CONCURRENT_JOBS, USER_CONCURRENT_JOBS,
+)
+from modules.instagram import (
+    extract_instagram_urls, extract_username, open_video_stream, create_session, get_profile_reel_urls,
+)
+from modules.batch import FairShareLimiter, ProgressReporter, run_batch
+from modules.http_client import close_http_client
+from modules.gemini_service import process_video, generate_thumbnail, router, translation_memory, usage_ledger
+from modules.profiling import JobProfiler, LoopStallMonitor
 
 logger = logging.getLogger(__name__)
 
+# Sıradaki N işi profilleyen yardımcı (/profile komutu veya PROFILE_NEXT_JOBS ile)
+job_profiler = JobProfiler(PROFILE_DIR, PROFILE_SAMPLE_INTERVAL, PROFILE_NEXT_JOBS)
+
+# Genel ve kullanıcı başına eşzamanlı iş sınırı (tekli ve toplu işler için ortak)
+job_limiter = FairShareLimiter(MAX_CONCURRENT_JOBS, USER_CONCURRENT_JOBS)
+
+NO_SPEECH = "Bu videoda konuşma bulunamadı."
+
+
+def action_keyboard(prefix: str = "action") -> InlineKeyboardMarkup:
+    """Transkript / Thumbnail seçim butonları."""
+    keyboard = [
+        [
+            InlineKeyboardButton("📝 Transkript", callback_data=f"{prefix}_transcript"),
+            InlineKeyboardButton("🖼️ Thumbnail", callback_data=f"{prefix}_thumbnail"),
+        ]
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Bot başlatma komutu."""
@@ -23,19 +53,92 @@ göndereceğim!
 
 Örnek link formatları:
 - https://www.instagram.com/reel/ABC123/
-- https://www.instagram.com/p/XYZ789/"""
+- https://www.instagram.com/p/XYZ789/
+
+Tek mesajda birden fazla link gönderebilirsin; sonuçlar tek dosya olarak gelir.
+Bir profilin son reel'leri için: /reels <kullanıcı adı> [adet]"""
 
     await update.message.reply_text(welcome_message)
 
 
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Çeviri hafızası tasarruf istatistiklerini gösterir."""
+    await update.message.reply_text(f"📊 {translation_memory.report()}")
+
+
+async def usage_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Aksiyon başına Gemini kullanım/maliyet raporu (sadece admin)."""
+    if update.effective_user.id not in ADMIN_USER_IDS:
+        return
+
+    await update.message.reply_text(f"💰 Kullanım raporu\n\n{usage_ledger.report(router.hedged_requests)}")
+
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /profile N: sıradaki N işi profiller.
+    /profile: son profil dosyalarını gönderir. (Sadece admin)
+    """
+    if update.effective_user.id not in ADMIN_USER_IDS:
+        return
+
+    if context.args:
+        try:
+            jobs = int(context.args[0])
+        except ValueError:
+            await update.message.reply_text("Kullanım: /profile <iş sayısı>")
+            return
+        job_profiler.arm(jobs)
+        await update.message.reply_text(f"🔬 Sıradaki {jobs} iş profillenecek.")
+        return
+
+    files = job_profiler.latest_files()
+    if not files:
+        await update.message.reply_text("Henüz profil dosyası yok.")
+        return
+    for path in files:
+        with open(path, 'rb') as f:
+            await update.message.reply_document(document=f, filename=os.path.basename(path))
+
+
+async def reels_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/reels <kullanıcı adı veya profil linki> [adet]: profilin son reel'lerini toplu işler."""
+    username = extract_username(context.args[0]) if context.args else None
+    if not username:
+        await update.message.reply_text(f"Kullanım: /reels <kullanıcı adı> [adet (en fazla {BATCH_MAX_ITEMS})]")
+        return
+
+    count = BATCH_MAX_ITEMS
+    if len(context.args) > 1 and context.args[1].isdigit():
+        count = max(1, min(int(context.args[1]), BATCH_MAX_ITEMS))
+
+    message = await update.message.reply_text(f"🔎 @{username} profilinin son {count} reel'i aranıyor...")
+    try:
+        # Aynı oturum profil okuması ve toplu indirme için kullanılır
+        session = await asyncio.to_thread(create_session)
+        urls = await get_profile_reel_urls(username, count, session)
+    except Exception as e:
+        logger.error(f"Profil hatası: {str(e)}")
+        await message.edit_text(f"❌ Profil okunamadı: {e}")
+        return
+
+    if not urls:
+        await message.edit_text("❌ Bu profilde video bulunamadı.")
+        return
+
+    context.user_data['instagram_urls'] = urls
+    context.user_data['instagram_session'] = session
+    await message.edit_text(f"{len(urls)} reel bulundu. Ne yapmak istiyorsun?", reply_markup=action_keyboard("batch"))
+
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Gelen mesajları işler."""
     text = update.message.text
 
-    # Instagram URL'si var mı kontrol et
-    instagram_url = extract_instagram_url(text)
+    # Instagram URL'leri var mı kontrol et
+    instagram_urls = extract_instagram_urls(text)
 
-    if not instagram_url:
+    if not instagram_urls:
         await update.message.reply_text(
             "Bu geçerli bir Instagram linki değil.\n\n"
             "Lütfen şu formatlarda bir link gönderin:\n"
@@ -44,21 +147,26 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
+    # Birden fazla link: toplu işlem
+    if len(instagram_urls) > 1:
+        context.user_data['instagram_urls'] = instagram_urls[:BATCH_MAX_ITEMS]
+        context.user_data.pop('instagram_session', None)
+        note = ""
+        if len(instagram_urls) > BATCH_MAX_ITEMS:
+            note = f" (ilk {BATCH_MAX_ITEMS} tanesi işlenecek)"
+        await update.message.reply_text(
+            f"{len(instagram_urls)} link bulundu{note}. Ne yapmak istiyorsun?",
+            reply_markup=action_keyboard("batch")
+        )
+        return
+
     # URL'yi context'e kaydet
-    context.user_data['instagram_url'] = instagram_url
+    context.user_data['instagram_url'] = instagram_urls[0]
 
     # Seçenek butonları göster
-    keyboard = [
-        [
-            InlineKeyboardButton("📝 Transkript", callback_data="action_transcript"),
-            InlineKeyboardButton("🖼️ Thumbnail", callback_data="action_thumbnail"),
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
     await update.message.reply_text(
         "Ne yapmak istiyorsun?",
-        reply_markup=reply_markup
+        reply_markup=action_keyboard()
     )
 
 
@@ -68,35 +176,166 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
     action = query.data
+    user_id = query.from_user.id
+
+    if action.startswith("batch_"):
+        instagram_urls = context.user_data.get('instagram_urls')
+        if not instagram_urls:
+            await query.edit_message_text("❌ Link bulunamadı. Lütfen linkleri tekrar gönderin.")
+            return
+
+        kind = action.removeprefix("batch_")
+        async with job_profiler.job(f"batch_{kind}"):
+            await process_batch(query, context, instagram_urls, kind)
+        return
+
     instagram_url = context.user_data.get('instagram_url')
 
     if not instagram_url:
         await query.edit_message_text("❌ Link bulunamadı. Lütfen tekrar bir Instagram linki gönderin.")
         return
 
+    # Tahmini maliyet iş kuyruğa girmeden ayrılır; süren işler de bütçeye sayılır
+    kind = action.removeprefix("action_")
+    budget_error = usage_ledger.reserve(user_id, kind, needs_image=kind == "thumbnail")
+    if budget_error:
+        await query.edit_message_text(f"⛔ {budget_error}\nYarın tekrar deneyebilirsin.")
+        return
+
     if action == "action_transcript":
-        await process_transcript(query, context, instagram_url)
+        with usage_ledger.job(user_id, "transcript", reserved=True):
+            async with job_profiler.job("transcript"), job_limiter.slot(user_id):
+                await process_transcript(query, context, instagram_url)
     elif action == "action_thumbnail":
-        await process_thumbnail_request(query, context, instagram_url)
+        with usage_ledger.job(user_id, "thumbnail", reserved=True):
+            async with job_profiler.job("thumbnail"), job_limiter.slot(user_id):
+                await process_thumbnail_request(query, context, instagram_url)
+
+
+async def process_batch(query, context: ContextTypes.DEFAULT_TYPE, instagram_urls: list[str], kind: str):
+    """
+    Birden fazla videoyu kullanıcının eşzamanlı iş sınırı içinde işler; ilerlemeyi
+    tek mesajda gösterir ve sonuçları tek dosya olarak gönderir.
+
+    Tüm öğeler aynı Instagram oturumunu (/reels ile açıldıysa onu), HTTP havuzunu
+    ve Gemini client'ını paylaşır.
+    """
+    user_id = query.from_user.id
+    chat_id = query.message.chat_id
+    total = len(instagram_urls)
+    progress = ProgressReporter(query.edit_message_text)
+
+    # Tüm öğelerin tahmini maliyeti baştan ayrılır; bütçe yetmiyorsa hiçbiri başlamaz
+    budget_error = usage_ledger.reserve(user_id, kind, jobs=total, needs_image=kind == "thumbnail")
+    if budget_error:
+        await query.edit_message_text(f"⛔ {budget_error}\nYarın tekrar deneyebilirsin.")
+        return
+
+    # Her öğe bitince kendi payını bırakır; hiç başlamayanlarınki sonda bırakılır
+    started = 0
+    try:
+        await progress.update(f"⏳ {total} video işleniyor...", force=True)
+        try:
+            session = context.user_data.get('instagram_session') or await asyncio.to_thread(create_session)
+        except Exception as e:
+            logger.error(f"Instagram oturumu açılamadı: {str(e)}")
+            await query.edit_message_text("❌ Instagram'a bağlanılamadı. Lütfen tekrar deneyin.")
+            return
+
+        async def worker(instagram_url: str):
+            nonlocal started
+            started += 1
+            with usage_ledger.job(user_id, kind, reserved=True):
+                video_stream = await open_video_stream(instagram_url, session)
+                try:
+                    if kind == "transcript":
+                        return await process_video(video_stream)
+                    return await generate_thumbnail(video_stream)
+                finally:
+                    await video_stream.aclose()
+
+        async def on_progress(done: int, failed: int, total: int):
+            text = f"⏳ {done}/{total} video tamamlandı"
+            if failed:
+                text += f" ({failed} hata)"
+            await progress.update(text, force=done == total)
+
+        results = await run_batch(instagram_urls, worker, job_limiter, user_id, on_progress)
+    finally:
+        usage_ledger.release(user_id, jobs=total - started)
+
+    failed = sum(1 for r in results if isinstance(r, Exception))
+    if failed == total:
+        await query.edit_message_text(f"❌ {total} videonun hiçbiri işlenemedi. Lütfen tekrar deneyin.")
+        return
+
+    if kind == "transcript":
+        document = build_transcript_document(instagram_urls, results)
+    else:
+        document = build_thumbnail_archive(instagram_urls, results)
+
+    await query.edit_message_text(f"✅ {total - failed}/{total} video işlendi. Sonuçlar dosyada.")
+    await context.bot.send_document(chat_id=chat_id, document=document, filename=document.name)
+
+
+def build_transcript_document(instagram_urls: list[str], results: list) -> io.BytesIO:
+    """Toplu transkript sonuçlarını tek bir metin dosyasında birleştirir."""
+    sections = []
+    for i, (url, result) in enumerate(zip(instagram_urls, results), start=1):
+        header = f"{i}. {url}\n{'=' * 40}"
+        if isinstance(result, Exception):
+            sections.append(f"{header}\n❌ Hata: {result}")
+        elif result['original'] == NO_SPEECH:
+            sections.append(f"{header}\n{NO_SPEECH}")
+        else:
+            sections.append(
+                f"{header}\n"
+                f"📝 Orijinal Transkript:\n{result['original']}\n\n"
+                f"🇹🇷 Türkçe:\n{result['turkish']}\n\n"
+                f"🇬🇧 English:\n{result['english']}"
+            )
+
+    document = io.BytesIO("\n\n\n".join(sections).encode('utf-8'))
+    document.name = "transkriptler.txt"
+    return document
+
+
+def build_thumbnail_archive(instagram_urls: list[str], results: list) -> io.BytesIO:
+    """Toplu thumbnail sonuçlarını görseller ve özet dosyasıyla tek bir zip'te birleştirir."""
+    document = io.BytesIO()
+    summary = []
+    with zipfile.ZipFile(document, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for i, (url, result) in enumerate(zip(instagram_urls, results), start=1):
+            if isinstance(result, Exception):
+                summary.append(f"{i}. {url}\n❌ Hata: {result}")
+                continue
+            image_bytes, hook_text, transcript = result
+            archive.writestr(f"thumbnail_{i:02d}.png", image_bytes)
+            summary.append(f"{i}. {url}\nHook: {hook_text}\n\n{transcript}")
+        archive.writestr("ozet.txt", "\n\n\n".join(summary))
+
+    document.seek(0)
+    document.name = "thumbnails.zip"
+    return document
 
 
 async def process_transcript(query, context: ContextTypes.DEFAULT_TYPE, instagram_url: str):
     """Transkript işlemini gerçekleştirir."""
     await query.edit_message_text("⏳ Video indiriliyor...")
-    temp_dir = None
+    video_stream = None
 
     try:
-        # Video indir
-        video_path, temp_dir = await download_video(instagram_url)
+        # Video akışını aç (indirme ve Gemini'ye yükleme eşzamanlı ilerler)
+        video_stream = await open_video_stream(instagram_url)
 
         # Durum güncelle
         await query.edit_message_text("🎯 Transkript çıkarılıyor ve çeviriler hazırlanıyor...")
 
         # Transkript ve çeviri
-        result = await process_video(video_path)
+        result = await process_video(video_stream)
 
         # Sonuç mesajını formatla
-        if result['original'] == "Bu videoda konuşma bulunamadı.":
+        if result['original'] == NO_SPEECH:
             await query.edit_message_text("❌ Bu videoda konuşma bulunamadı.")
             return
 
@@ -143,24 +382,24 @@ async def process_transcript(query, context: ContextTypes.DEFAULT_TYPE, instagra
 
     finally:
         # Temizlik
-        if temp_dir:
-            cleanup(temp_dir)
+        if video_stream:
+            await video_stream.aclose()
 
 
 async def process_thumbnail_request(query, context: ContextTypes.DEFAULT_TYPE, instagram_url: str):
     """Thumbnail oluşturma işlemini gerçekleştirir."""
     await query.edit_message_text("⏳ Video indiriliyor...")
-    temp_dir = None
+    video_stream = None
 
     try:
-        # Video indir
-        video_path, temp_dir = await download_video(instagram_url)
+        # Video akışını aç (indirme ve Gemini'ye yükleme eşzamanlı ilerler)
+        video_stream = await open_video_stream(instagram_url)
 
         # Durum güncelle
         await query.edit_message_text("🎨 Thumbnail oluşturuluyor... (Bu biraz zaman alabilir)")
 
         # Thumbnail oluştur
-        image_bytes, hook_text, transcript = await generate_thumbnail(video_path)
+        image_bytes, hook_text, transcript = await generate_thumbnail(video_stream)
 
         # Görseli gönder
         chat_id = query.message.chat_id
@@ -177,7 +416,7 @@ async def process_thumbnail_request(query, context: ContextTypes.DEFAULT_TYPE, i
         )
 
         # Transkripti de gönder
-        if transcript and transcript != "Bu videoda konuşma bulunamadı.":
+        if transcript and transcript != NO_SPEECH:
             transcript_message = f"📝 **Transkript:**\n\n{transcript}"
             if len(transcript_message) > 4000:
                 transcript_message = transcript_message[:4000] + "..."
@@ -199,16 +438,48 @@ async def process_thumbnail_request(query, context: ContextTypes.DEFAULT_TYPE, i
 
     finally:
         # Temizlik
-        if temp_dir:
-            cleanup(temp_dir)
+        if video_stream:
+            await video_stream.aclose()
+
+
+async def start_loop_monitor(application: Application):
+    """LOOP_STALL_THRESHOLD verildiyse event loop takılmalarını izlemeye başlar."""
+    if LOOP_STALL_THRESHOLD > 0:
+        monitor = LoopStallMonitor(LOOP_STALL_THRESHOLD, os.path.join(PROFILE_DIR, 'loop_stalls.log'))
+        monitor.start()
+        application.bot_data['loop_monitor'] = monitor
+
+
+async def shutdown_resources(application: Application):
+    """
+    Takılma izleyicisini durdurur, bekleyen çeviri hafızası kayıtlarını yazar ve
+    ortak HTTP bağlantı havuzunu kapatır.
+    """
+    monitor = application.bot_data.pop('loop_monitor', None)
+    if monitor:
+        monitor.stop()
+    await translation_memory.flush()
+    await close_http_client()
 
 
 def create_bot() -> Application:
     """Telegram bot uygulamasını oluşturur."""
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        # Güncellemeler paralel işlenir; eşzamanlılık job_limiter ile sınırlanır
+        .concurrent_updates(True)
+        .post_init(start_loop_monitor)
+        .post_shutdown(shutdown_resources)
+        .build()
+    )
 
     # Handler'ları ekle
     application.add_handler(CommandHandler("start", start_command))
+    application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(CommandHandler("usage", usage_command))
+    application.add_handler(CommandHandler("profile", profile_command))
+    application.add_handler(CommandHandler("reels", reels_command))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     application.add_handler(CallbackQueryHandler(handle_callback))
 
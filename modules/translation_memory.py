@@ -0,0 +1,232 @@
+import os
+import re
+import asyncio
+import json
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Sadece Türkçede bulunan harfler (ç, ö, ü Almanca/Azericede de geçtiği için sayılmaz)
+TURKISH_CHARS = set("ıİğĞşŞ")
+
+# Türkçe veya İngilizce alfabede olmayan harfler (ə, ñ, ä, é...) başka bir dile işaret eder
+KNOWN_LETTERS = set("abcdefghijklmnopqrstuvwxyzçğıöşüâîû") | set("ABCDEFGHIJKLMNOPQRSTUVWXYZÇĞİÖŞÜÂÎÛ")
+
+# Sık geçen ve başka dillerde (İspanyolca, Portekizce, Almanca...) kelime olarak
+# geçmeyen kelimeler; "de", "da", "ne", "mi", "ya", "in", "so" gibi ortaklar bilerek yok
+TURKISH_WORDS = {
+    "bir", "bu", "için", "ile", "çok", "gibi", "daha", "yok", "biz", "siz",
+    "onlar", "şey", "olarak", "kadar", "sonra", "önce", "şimdi", "nasıl",
+    "neden", "hiç", "evet", "hayır", "değil", "veya", "şu", "ise",
+}
+ENGLISH_WORDS = {
+    "the", "and", "is", "are", "were", "you", "to", "of", "it", "that",
+    "this", "for", "with", "be", "have", "has", "not", "but", "what", "how",
+    "why", "your", "my", "we", "they", "can", "just", "if", "don't", "at",
+    "from", "about", "all", "there",
+}
+
+# Dil kararı için gereken en düşük kelime oranı farkı
+DETECTION_MARGIN = 0.15
+
+# Bundan kısa metinlerde karar verilmez (model dili kendisi anlar)
+MIN_DETECTION_WORDS = 5
+
+# Kaba token tahmini (Gemini için ~4 karakter/token)
+CHARS_PER_TOKEN = 4
+
+
+def detect_language(text: str) -> str | None:
+    """
+    Metnin Türkçe mi İngilizce mi olduğunu yerel olarak tahmin eder.
+
+    Yanlış bir karar çevirinin atlanmasına yol açtığı için temkinlidir: metin
+    kısaysa, iki alfabede de olmayan bir harf içeriyorsa veya işaretler yeterince
+    ayrışmıyorsa None döndürür.
+
+    Returns:
+        "Turkish", "English" veya emin olunamazsa None
+    """
+    words = re.findall(r"[\w']+", text.lower())
+    if len(words) < MIN_DETECTION_WORDS:
+        return None
+    if any(c.isalpha() and c not in KNOWN_LETTERS for c in text):
+        return None
+
+    turkish_chars = sum(1 for c in text if c in TURKISH_CHARS)
+    turkish_score = sum(1 for w in words if w in TURKISH_WORDS) / len(words)
+    english_score = sum(1 for w in words if w in ENGLISH_WORDS) / len(words)
+
+    # Türkçeye özgü harfler güçlü bir işaret; İngilizce metinde neredeyse hiç geçmez
+    turkish_score += min(turkish_chars / len(words), 1.0) * 0.5
+
+    if turkish_score - english_score >= DETECTION_MARGIN:
+        return "Turkish"
+    if english_score - turkish_score >= DETECTION_MARGIN and turkish_chars == 0:
+        return "English"
+    return None
+
+
+def normalize_text(text: str) -> str:
+    """Anahtar üretimi için metni normalize eder (boşluk, büyük/küçük harf, unicode)."""
+    text = unicodedata.normalize("NFC", text)
+    return " ".join(text.split()).casefold()
+
+
+def estimate_tokens(text: str) -> int:
+    """Metnin yaklaşık token sayısını döndürür."""
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def split_sentences(text: str) -> list[str]:
+    """Metni cümlelere böler (cümle düzeyinde hafıza anahtarları için)."""
+    return [s for s in split_sentences_with_separators(text)[0] if s]
+
+
+def split_sentences_with_separators(text: str) -> tuple[list[str], list[str]]:
+    """
+    Metni cümlelere ve aralarındaki boşluklara böler; satır sonları korunarak
+    yeniden birleştirilebilsin diye ayraçlar da döndürülür.
+
+    Returns:
+        (cümleler, ayraçlar); ayraç sayısı cümle sayısından bir eksiktir
+    """
+    parts = re.split(r'(?<=[.!?…])(\s+)', text.strip())
+    return parts[0::2], parts[1::2]
+
+
+def parse_numbered_lines(text: str, expected: int) -> list[str] | None:
+    """
+    "1. ..." biçimindeki model yanıtını satırlara ayırır.
+
+    Numarasız bir satır (ör. ikiye bölünmüş çeviri) veya tutmayan numaralar
+    çözümlemeyi geçersiz kılar ve None döndürülür; eksik çeviri hafızaya girmez.
+    """
+    lines = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        match = re.match(r'\s*(\d+)[.)]\s*(.*)', line)
+        if not match or int(match.group(1)) in lines:
+            return None
+        lines[int(match.group(1))] = match.group(2).strip()
+    if sorted(lines) != list(range(1, expected + 1)):
+        return None
+    return [lines[i] for i in range(1, expected + 1)]
+
+
+class TranslationMemory:
+    """
+    Normalize edilmiş metin hash'i + hedef dil anahtarıyla çalışan çeviri hafızası.
+
+    Hem metnin tamamı hem de tek tek cümleleri saklanır; böylece farklı videolarda
+    tekrar eden cümleler de yeniden kullanılır. Kayıtlar LRU sırasıyla tutulur ve
+    verilirse JSON dosyasına yazılır; yazma işlemi birkaç saniye biriktirilip
+    event loop dışında (thread'de) yapılır.
+    """
+
+    def __init__(self, path: str | None = None, max_entries: int = 5000, save_delay: float = 5.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.save_delay = save_delay
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._save_task = None
+        self.stats = Counter()
+        self._load()
+
+    @staticmethod
+    def make_key(text: str, target_language: str) -> str:
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"{target_language}:{digest}"
+
+    def get(self, text: str, target_language: str) -> str | None:
+        """Hafızada varsa çeviriyi döndürür."""
+        key = self.make_key(text, target_language)
+        with self._lock:
+            translation = self._entries.get(key)
+            if translation is not None:
+                self._entries.move_to_end(key)
+        return translation
+
+    def put(self, text: str, target_language: str, translation: str):
+        """Yeni çeviriyi kaydeder; dosyaya yazma ertelenir."""
+        key = self.make_key(text, target_language)
+        with self._lock:
+            self._entries[key] = translation
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        self._schedule_save()
+
+    def count(self, job_stats: Counter | None = None, **deltas: int):
+        """Tasarruf sayaçlarını hem genel toplamda hem (verilirse) iş sayacında artırır."""
+        with self._lock:
+            self.stats.update(deltas)
+        if job_stats is not None:
+            job_stats.update(deltas)
+
+    def saved_calls(self) -> int:
+        return self.stats['saved_calls']
+
+    def report(self) -> str:
+        """Tasarruf özetini okunabilir metin olarak döndürür."""
+        return (
+            f"Çeviri hafızası: {len(self._entries)} kayıt\n"
+            f"Hafızadan gelen (tüm metin): {self.stats['hits']}\n"
+            f"Hafızadan gelen (cümle): {self.stats['phrase_hits']}\n"
+            f"Aynı dil (atlanan): {self.stats['same_language_skips']}\n"
+            f"Model çağrısı: {self.stats['model_calls']}\n"
+            f"Tasarruf edilen çağrı: {self.saved_calls()}\n"
+            f"Tasarruf edilen token (tahmini): {self.stats['saved_tokens']}"
+        )
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._entries = OrderedDict(json.load(f))
+        except Exception as e:
+            logger.warning(f"Çeviri hafızası okunamadı: {e}")
+
+    def _schedule_save(self):
+        if not self.path or self._save_task is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Event loop dışında (ör. script) doğrudan yaz
+            self._write(dict(self._entries))
+            return
+        self._save_task = loop.create_task(self._save_later())
+
+    async def _save_later(self):
+        await asyncio.sleep(self.save_delay)
+        # Yazma sürerken gelen yeni kayıtlar bir sonraki yazmayı planlar
+        self._save_task = None
+        await self.flush()
+
+    async def flush(self):
+        """Bekleyen kayıtları dosyaya yazar (kapanışta da çağrılır)."""
+        if not self.path:
+            return
+        with self._lock:
+            entries = dict(self._entries)
+        await asyncio.to_thread(self._write, entries)
+
+    def _write(self, entries: dict):
+        try:
+            data = json.dumps(entries, ensure_ascii=False)
+            with self._write_lock:
+                tmp_path = self.path + ".tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(data)
+                os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"Çeviri hafızası kaydedilemedi: {e}")
@@ -0,0 +1,280 @@
+import re
+import math
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import date
+
+from modules.translation_memory import CHARS_PER_TOKEN, ENGLISH_WORDS, TURKISH_WORDS, estimate_tokens, split_sentences
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class JobUsage:
+    """Tek bir işin (transkript, thumbnail...) Gemini kullanımı."""
+
+    user_id: int
+    action: str
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    images: int = 0
+    calls: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.output_tokens
+
+
+# O an yürütülen iş; asyncio task'ları ve to_thread çağrıları context'i devralır
+current_job: ContextVar[JobUsage | None] = ContextVar("current_job", default=None)
+
+
+# Henüz tamamlanmış işi olmayan aksiyonlar için iş başına tahmini token
+# (kısa bir Reels videosunun transkripti + çevirileri bu mertebededir)
+DEFAULT_JOB_TOKENS = 20000
+
+
+class UsageLedger:
+    """
+    Gemini çağrılarının `usage_metadata` bilgisini iş, kullanıcı (günlük) ve
+    aksiyon bazında toplar; kullanıcıların günlük bütçesini uygular.
+
+    Kuyruğa giren her iş tahmini maliyetini baştan ayırır (reserve) ve bitince
+    bırakır; böylece eşzamanlı veya sırada bekleyen işler ve toplu istekler,
+    henüz kaydedilmemiş kullanımları yüzünden bütçeyi birlikte aşamaz.
+
+    Bütçe 0 ise sınırsızdır.
+    """
+
+    def __init__(self, daily_token_budget: int = 0, daily_image_budget: int = 0, today=date.today):
+        self.daily_token_budget = daily_token_budget
+        self.daily_image_budget = daily_image_budget
+        self.today = today
+        self._lock = threading.Lock()
+        self._daily: dict[tuple[int, date], JobUsage] = {}
+        self._actions: dict[str, JobUsage] = {}
+        self._action_jobs: Counter = Counter()
+        # Kullanıcı -> süren/bekleyen işlerin ayrılmış maliyeti (tokens, images, jobs)
+        self._reserved: dict[int, Counter] = {}
+
+    @contextmanager
+    def job(self, user_id: int, action: str, reserved: bool = False):
+        """
+        İş boyunca yapılan çağrıları bu işe ve kullanıcıya yazar.
+
+        `reserved` verilirse iş bitince kullanıcının bir işlik ayrımı bırakılır.
+        """
+        usage = JobUsage(user_id, action)
+        token = current_job.set(usage)
+        try:
+            yield usage
+        finally:
+            current_job.reset(token)
+            if reserved:
+                self.release(user_id)
+            with self._lock:
+                totals = self._actions.setdefault(action, JobUsage(0, action))
+                totals.prompt_tokens += usage.prompt_tokens
+                totals.output_tokens += usage.output_tokens
+                totals.images += usage.images
+                totals.calls += usage.calls
+                self._action_jobs[action] += 1
+            logger.info(f"İş kullanımı ({action}, kullanıcı {user_id}): "
+                        f"{usage.total_tokens} token, {usage.images} görsel, {usage.calls} çağrı")
+
+    def record(self, usage_metadata, images: int = 0):
+        """Bir Gemini yanıtının kullanımını aktif işe ve kullanıcının günlük toplamına ekler."""
+        usage = current_job.get()
+        if usage is None:
+            return
+
+        prompt_tokens = getattr(usage_metadata, 'prompt_token_count', None) or 0
+        output_tokens = getattr(usage_metadata, 'candidates_token_count', None) or 0
+
+        today = self.today()
+        with self._lock:
+            key = (usage.user_id, today)
+            if key not in self._daily:
+                # Gün değiştiyse önceki günlerin kayıtlarını at; sözlük sınırsız büyümesin
+                for old_key in [k for k in self._daily if k[1] != today]:
+                    del self._daily[old_key]
+                self._daily[key] = JobUsage(usage.user_id, "daily")
+            daily = self._daily[key]
+            for entry in (usage, daily):
+                entry.prompt_tokens += prompt_tokens
+                entry.output_tokens += output_tokens
+                entry.images += images
+                entry.calls += 1
+
+    def daily_usage(self, user_id: int) -> JobUsage:
+        with self._lock:
+            return self._daily.get((user_id, self.today()), JobUsage(user_id, "daily"))
+
+    def _estimate(self, action: str, needs_image: bool) -> tuple[int, int]:
+        """Aksiyonun iş başına ortalama maliyeti; geçmiş yoksa varsayılan tahmin."""
+        jobs = self._action_jobs[action]
+        if jobs:
+            totals = self._actions[action]
+            tokens = totals.total_tokens // jobs
+            images = math.ceil(totals.images / jobs)
+        else:
+            tokens, images = DEFAULT_JOB_TOKENS, 0
+        return tokens, (max(images, 1) if needs_image else images)
+
+    def reserve(self, user_id: int, action: str, jobs: int = 1, needs_image: bool = False) -> str | None:
+        """
+        `jobs` işin tahmini maliyetini kullanıcının günlük bütçesinden ayırır.
+
+        Kaydedilmiş kullanım + süren işlerin ayrımı + yeni işler bütçeyi aşıyorsa
+        hiçbir şey ayrılmaz.
+
+        Returns:
+            Bütçe yetmiyorsa kullanıcıya gösterilecek açıklama, aksi halde None
+        """
+        with self._lock:
+            tokens, images = self._estimate(action, needs_image)
+            usage = self._daily.get((user_id, self.today()), JobUsage(user_id, "daily"))
+            reserved = self._reserved.get(user_id, Counter())
+
+            if self.daily_token_budget:
+                used = usage.total_tokens
+                if used >= self.daily_token_budget:
+                    return f"Günlük token limitine ulaştın ({used}/{self.daily_token_budget})."
+                if used + reserved['tokens'] + tokens * jobs > self.daily_token_budget:
+                    return (f"Günlük token limitin bu iş için yetmiyor (kullanılan {used}, "
+                            f"süren işler ~{reserved['tokens']}, bu istek ~{tokens * jobs}, "
+                            f"limit {self.daily_token_budget}).")
+            if needs_image and self.daily_image_budget:
+                used = usage.images
+                if used >= self.daily_image_budget:
+                    return f"Günlük görsel limitine ulaştın ({used}/{self.daily_image_budget})."
+                if used + reserved['images'] + images * jobs > self.daily_image_budget:
+                    return (f"Günlük görsel limitin bu iş için yetmiyor (kullanılan {used}, "
+                            f"süren işler {reserved['images']}, bu istek {images * jobs}, "
+                            f"limit {self.daily_image_budget}).")
+
+            self._reserved.setdefault(user_id, Counter()).update(
+                tokens=tokens * jobs, images=images * jobs, jobs=jobs,
+            )
+        return None
+
+    def release(self, user_id: int, jobs: int = 1):
+        """Kullanıcının `jobs` işlik ayrımını (ortalama payını) bırakır."""
+        with self._lock:
+            reserved = self._reserved.get(user_id)
+            for _ in range(jobs):
+                if not reserved or reserved['jobs'] <= 0:
+                    break
+                share = reserved['jobs']
+                reserved['tokens'] -= reserved['tokens'] // share
+                reserved['images'] -= reserved['images'] // share
+                reserved['jobs'] -= 1
+            if reserved is not None and reserved['jobs'] <= 0:
+                del self._reserved[user_id]
+
+    def report(self, hedged_requests: int = 0) -> str:
+        """
+        Aksiyon başına toplam ve ortalama maliyeti metin olarak döndürür.
+
+        Yarışı kaybeden hedge istekleri iptal edildiği için yanıtları (ve
+        usage_metadata'ları) hiç gelmez; upstream'de yine faturalanırlar ama
+        burada sayılmazlar. Bu yüzden sayıları ayrıca gösterilir.
+        """
+        with self._lock:
+            if not self._actions:
+                return "Henüz kayıtlı kullanım yok."
+            lines = []
+            for action, totals in sorted(self._actions.items()):
+                jobs = self._action_jobs[action]
+                lines.append(
+                    f"{action}: {jobs} iş, {totals.total_tokens} token "
+                    f"(giriş {totals.prompt_tokens} / çıkış {totals.output_tokens}), "
+                    f"{totals.images} görsel, {totals.calls} çağrı\n"
+                    f"  iş başına ~{totals.total_tokens // jobs} token, "
+                    f"{totals.images / jobs:.2f} görsel"
+                )
+            users_today = sum(1 for (_, day) in self._daily if day == self.today())
+        lines.append(f"Bugün aktif kullanıcı: {users_today}")
+        if hedged_requests:
+            lines.append(f"Hedge isteği: {hedged_requests} (kaybedenler faturalanır ama yukarıdaki toplamlara dahil değildir)")
+        return "\n".join(lines)
+
+
+def _split_segments(text: str, max_words: int = 25) -> list[str]:
+    """Metni cümlelere, noktalama yoksa kelime pencerelerine böler."""
+    segments = []
+    for sentence in split_sentences(text):
+        words = sentence.split()
+        for i in range(0, len(words), max_words):
+            segments.append(" ".join(words[i:i + max_words]))
+    return [s for s in segments if s]
+
+
+def _drop_near_duplicates(segments: list[str], threshold: float = 0.8) -> list[str]:
+    """
+    Aynı veya neredeyse aynı (kelime kümesi Jaccard benzerliği >= threshold)
+    cümlelerin sadece ilkini tutar; tekrar eden bir cümle bütçeyi doldurmasın.
+    """
+    kept = []
+    kept_words = []
+    for segment in segments:
+        words = set(re.findall(r"\w+", segment.lower()))
+        if words and any(len(words & other) / len(words | other) >= threshold for other in kept_words):
+            continue
+        kept.append(segment)
+        kept_words.append(words)
+    return kept
+
+
+def truncate_to_token_budget(text: str, max_tokens: int) -> str:
+    """
+    Uzun metni token bütçesine sığdırır; baştan kesmek yerine en bilgilendirici
+    cümleleri seçer.
+
+    Tekrar eden cümleler önce ayıklanır. İlk cümle (genelde konunun söylendiği
+    yer) her zaman tutulur; kalan cümleler içerdikleri içerik kelimelerinin tf-idf
+    ağırlığına göre puanlanır ve orijinal sırayla birleştirilir.
+
+    Bütçe gerçek tokenizer ile değil, karakter tabanlı tahminle (estimate_tokens,
+    ~4 karakter/token) izlenir; count_tokens her prompt için ayrı bir API çağrısı
+    gerektirirdi. Sonuç bu yüzden bütçeye yaklaşık olarak uyar.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    segments = _drop_near_duplicates(_split_segments(text))
+    stopwords = TURKISH_WORDS | ENGLISH_WORDS
+
+    def content_words(segment: str) -> list[str]:
+        return [w for w in re.findall(r"\w+", segment.lower()) if len(w) > 3 and w not in stopwords]
+
+    # Sık geçen ama her cümlede tekrar etmeyen kelimeler konuyu taşır (tf-idf)
+    segment_words = [content_words(segment) for segment in segments]
+    frequencies = Counter(w for words in segment_words for w in words)
+    document_frequencies = Counter(w for words in segment_words for w in set(words))
+
+    def score(i: int) -> float:
+        words = set(segment_words[i])
+        if not words:
+            return 0.0
+        weight = sum(frequencies[w] * math.log(len(segments) / document_frequencies[w]) for w in words)
+        return weight / len(segments[i].split())
+
+    ranked = sorted(range(1, len(segments)), key=score, reverse=True)
+    # Bütçe karakter cinsinden izlenir (token tahmini de karakter tabanlı)
+    budget = max_tokens * CHARS_PER_TOKEN
+    chosen = {0}
+    used = len(segments[0])
+    for i in ranked:
+        cost = len(segments[i]) + 1
+        if used + cost <= budget:
+            chosen.add(i)
+            used += cost
+
+    result = " ".join(segments[i] for i in sorted(chosen))
+    # İlk cümle tek başına bütçeyi aşıyorsa karakter bazında kes
+    return result[:budget]
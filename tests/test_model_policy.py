@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+from modules.model_policy import CircuitBreaker, ModelRouter, StagePolicy, TryNextModel
+
+
+class ApiError(Exception):
+    """google-genai / httpx hatalarını taklit eden, durum kodlu hata."""
+
+    def __init__(self, code: int):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+def make_router(**policy) -> ModelRouter:
+    policy.setdefault('backoff', 0.0)
+    return ModelRouter({'stage': StagePolicy(models=['primary', 'fallback'], **policy)})
+
+
+def test_hedge_wins_when_primary_is_slow():
+    router = make_router(hedge=True, hedge_delay=0.05)
+    calls = []
+
+    async def request(model):
+        calls.append(model)
+        # İlk istek takılır, hedge isteği hemen döner
+        await asyncio.sleep(10 if len(calls) == 1 else 0)
+        return f"{model}-{len(calls)}"
+
+    assert asyncio.run(router.run('stage', request)) == "primary-2"
+    assert calls == ['primary', 'primary']
+    assert router.hedged_requests == 1
+    # Kaydedilen gecikme hedge isteğinin kendisine ait; hedge beklemesini içermez
+    assert router.latency._samples['primary'][0] < 0.05
+
+
+def test_retries_then_falls_back_on_transient_error():
+    router = make_router(max_retries=1)
+    calls = []
+
+    async def request(model):
+        calls.append(model)
+        if model == 'primary':
+            raise ApiError(503)
+        return "ok"
+
+    assert asyncio.run(router.run('stage', request)) == "ok"
+    assert calls == ['primary', 'primary', 'fallback']
+
+
+def test_permanent_error_is_raised_immediately():
+    router = make_router(max_retries=2)
+    calls = []
+
+    async def request(model):
+        calls.append(model)
+        raise ApiError(400)
+
+    with pytest.raises(ApiError):
+        asyncio.run(router.run('stage', request))
+    assert calls == ['primary']
+    assert not router.breaker._failures
+
+
+def test_deadline_raises_timeout():
+    router = make_router(deadline=0.1, attempt_timeout=1.0)
+
+    async def request(model):
+        await asyncio.sleep(10)
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(router.run('stage', request))
+
+
+def test_breaker_opens_and_skips_model():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=3, cooldown=60.0, clock=lambda: now[0])
+    router = ModelRouter(
+        {'stage': StagePolicy(models=['primary', 'fallback'], max_retries=2, backoff=0.0)},
+        breaker=breaker,
+    )
+    calls = []
+
+    async def request(model):
+        calls.append(model)
+        if model == 'primary':
+            raise ApiError(429)
+        return "ok"
+
+    assert asyncio.run(router.run('stage', request)) == "ok"
+    assert calls == ['primary', 'primary', 'primary', 'fallback']
+    assert router.candidates('stage') == ['fallback']
+
+    # Bekleme süresi dolunca model tekrar denenir
+    now[0] = 61.0
+    assert router.candidates('stage') == ['primary', 'fallback']
+
+
+def test_try_next_model_falls_back_without_retry():
+    router = make_router(max_retries=2)
+    calls = []
+
+    async def request(model):
+        calls.append(model)
+        if model == 'primary':
+            raise TryNextModel("Görsel oluşturulamadı.")
+        return "image"
+
+    assert asyncio.run(router.run('stage', request)) == "image"
+    assert calls == ['primary', 'fallback']
+    assert not router.breaker._failures
@@ -0,0 +1,50 @@
+import pytest
+
+from modules.translation_memory import detect_language, parse_numbered_lines, split_sentences_with_separators
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Merhaba arkadaşlar, bugün sizlere yapay zeka ile neler yapabileceğinizi göstereceğim. "
+     "Bu araç çok işinize yarayacak.", "Turkish"),
+    ("Hey guys, today I'm going to show you how to use this tool for free and why it is so good.", "English"),
+])
+def test_detects_turkish_and_english(text, expected):
+    assert detect_language(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    # İspanyolca / Portekizce: "de", "da", "ne", "ya" gibi ortak kısa kelimeler
+    "Hola amigos, hoy vamos a hablar de la inteligencia artificial y de lo que se puede hacer con ella.",
+    "Oi pessoal hoje eu vou mostrar para voces como usar essa ferramenta de graca, ne? Da para fazer tudo.",
+    # Almanca: ö ve ü Türkçeye özgü değil
+    "Heute zeige ich euch, wie man mit künstlicher Intelligenz schöne Bilder über Nacht erstellt.",
+    # Azerice: ğ, ş, ı ortak ama ə Türkçede yok
+    "Salam dostlar, bu gün sizə süni intellekt haqqında danışacağam və çox maraqlı şeylər göstərəcəyəm.",
+])
+def test_other_languages_are_not_detected(text):
+    assert detect_language(text) is None
+
+
+def test_short_text_is_undecided():
+    assert detect_language("Merhaba arkadaşlar") is None
+    assert detect_language("") is None
+
+
+def test_parse_numbered_lines():
+    assert parse_numbered_lines("1. Merhaba.\n\n2) Nasılsın?", 2) == ["Merhaba.", "Nasılsın?"]
+    # Numaralar tutmuyor
+    assert parse_numbered_lines("1. Merhaba.", 2) is None
+    assert parse_numbered_lines("1. Merhaba.\n1. Selam.", 1) is None
+
+
+def test_parse_rejects_unnumbered_continuation_line():
+    reply = "1. Hello friends\ntoday I will talk about AI.\n2. It is free."
+    assert parse_numbered_lines(reply, 2) is None
+
+
+def test_split_sentences_keeps_separators():
+    text = "Merhaba arkadaşlar.\nBugün yapay zeka\nhakkında konuşacağım!  Başlayalım."
+    sentences, separators = split_sentences_with_separators(text)
+    assert sentences == ["Merhaba arkadaşlar.", "Bugün yapay zeka\nhakkında konuşacağım!", "Başlayalım."]
+    assert separators == ["\n", "  "]
+    assert sentences[0] + "".join(s + t for s, t in zip(separators, sentences[1:])) == text
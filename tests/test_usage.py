@@ -0,0 +1,68 @@
+from datetime import date
+from types import SimpleNamespace
+
+from modules.usage import UsageLedger, truncate_to_token_budget
+
+
+def test_short_text_is_unchanged():
+    assert truncate_to_token_budget("Kısa bir metin.", 150) == "Kısa bir metin."
+
+
+def test_repeated_sentences_do_not_fill_the_budget():
+    repeated = "Subscribe to the channel and hit the notification bell right now!"
+    sentences = [
+        "Today we compare three free image generation tools for designers.",
+        repeated,
+        "The first tool produces sharp portraits but struggles with typography.",
+        repeated.lower(),
+        "The second tool handles logos and text layouts surprisingly well.",
+        repeated,
+        "The third tool is the fastest option when you need many variations.",
+        repeated + " Thanks!",
+    ] * 4
+    result = truncate_to_token_budget(" ".join(sentences), 150)
+
+    assert result.lower().count("notification bell") == 1
+    assert "typography" in result
+    assert len(result) <= 150 * 4
+
+
+def test_reservations_count_in_flight_jobs():
+    ledger = UsageLedger(daily_token_budget=50000)
+
+    # Geçmiş yokken iş başına DEFAULT_JOB_TOKENS ayrılır
+    assert ledger.reserve(1, "transcript", jobs=2) is None
+    assert ledger.reserve(1, "transcript") is not None
+    assert ledger.reserve(2, "transcript") is None
+
+    ledger.release(1)
+    assert ledger.reserve(1, "transcript") is None
+
+
+def test_batch_reservation_is_rejected_up_front():
+    ledger = UsageLedger(daily_token_budget=50000)
+    assert ledger.reserve(1, "transcript", jobs=10) is not None
+    assert not ledger._reserved
+
+
+def test_finished_job_releases_reservation_and_updates_estimate():
+    ledger = UsageLedger(daily_token_budget=50000, daily_image_budget=2)
+    assert ledger.reserve(1, "thumbnail", needs_image=True) is None
+    with ledger.job(1, "thumbnail", reserved=True):
+        ledger.record(SimpleNamespace(prompt_token_count=900, candidates_token_count=100), images=1)
+    assert not ledger._reserved
+
+    # Tahmin artık aksiyonun ortalaması: 1000 token, 1 görsel
+    assert ledger.reserve(1, "thumbnail", needs_image=True) is None
+    assert ledger.reserve(1, "thumbnail", needs_image=True) is not None
+
+
+def test_daily_usage_from_earlier_days_is_pruned():
+    today = [date(2026, 1, 1)]
+    ledger = UsageLedger(today=lambda: today[0])
+    with ledger.job(1, "transcript"):
+        ledger.record(SimpleNamespace(prompt_token_count=10, candidates_token_count=5))
+    today[0] = date(2026, 1, 2)
+    with ledger.job(2, "transcript"):
+        ledger.record(SimpleNamespace(prompt_token_count=10, candidates_token_count=5))
+    assert list(ledger._daily) == [(2, date(2026, 1, 2))]